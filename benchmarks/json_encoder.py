@@ -0,0 +1,99 @@
+"""
+对比 API 响应的几种 JSON 序列化方式
+
+- legacy：改造前的实现，每次调用 json.dumps(obj, cls=...)，default 中对每个对象做 isinstance 判断
+- to_json：共享 encoder 实例，按类缓存转换函数，输出与 legacy 逐字节相同
+- orjson：JSON_BACKEND = 'orjson' 时的实现（已安装 orjson 时才测试），输出与 legacy 语义相同
+
+测试数据为与教室列表结构相同的 AllRooms 对象。
+
+用法（在项目根目录下）：python -m benchmarks.json_encoder [重复次数]
+"""
+import json
+import sys
+import timeit
+from dataclasses import dataclass
+from typing import Dict, List
+
+from everyclass.server.utils.jsonable import JSONSerializable, _orjson_default, orjson, to_json
+
+
+@dataclass
+class Room(JSONSerializable):
+    name: str
+    room_id: str
+    room_id_encoded: str
+
+    def __json_encode__(self):
+        return {'name': self.name, 'room_id_encoded': self.room_id_encoded}
+
+
+@dataclass
+class Building(JSONSerializable):
+    name: str
+    rooms: List[Room]
+
+    def __json_encode__(self):
+        return {'name': self.name, 'rooms': self.rooms}
+
+
+@dataclass
+class Campus(JSONSerializable):
+    name: str
+    buildings: List[Building]
+
+    def __json_encode__(self):
+        return {'name': self.name, 'buildings': self.buildings}
+
+
+@dataclass
+class AllRooms(JSONSerializable):
+    campuses: Dict[str, Campus]
+
+    def __json_encode__(self):
+        return {'campuses': self.campuses}
+
+
+class LegacyEncoder(json.JSONEncoder):
+    """改造前的 AdvancedJSONEncoder"""
+
+    def default(self, obj):
+        if isinstance(obj, JSONSerializable):
+            return obj.__json_encode__()
+        return json.JSONEncoder.default(self, obj)
+
+
+def make_payload():
+    campuses = {}
+    for c in range(4):
+        buildings = [Building(f'{c}校区{b}教学楼',
+                              [Room(f'{b}教{r:03d}', f'{c}{b}{r:03d}', f'room;{c}{b}{r:03d}abcdef') for r in range(120)])
+                     for b in range(10)]
+        campuses[f'校区{c}'] = Campus(f'校区{c}', buildings)
+    return {'status': 'success', 'data': AllRooms(campuses)}
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    payload = make_payload()
+
+    expected = json.dumps(payload, cls=LegacyEncoder)
+    assert to_json(payload) == expected
+
+    candidates = {
+        'legacy': lambda: json.dumps(payload, cls=LegacyEncoder).encode('utf-8'),
+        'to_json': lambda: to_json(payload).encode('utf-8'),
+    }
+    if orjson is not None:
+        option = orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        assert json.loads(orjson.dumps(payload, default=_orjson_default, option=option)) == json.loads(expected)
+        candidates['orjson'] = lambda: orjson.dumps(payload, default=_orjson_default, option=option)
+
+    print(f"payload: {len(expected)} bytes")
+    for name, func in candidates.items():
+        seconds = timeit.timeit(func, number=number)
+        print(f"{name:>9}: {seconds / number * 1000:.3f} ms/op")
+
+
+if __name__ == '__main__':
+    main()
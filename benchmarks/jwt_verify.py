@@ -0,0 +1,48 @@
+"""
+对比 token_required 中 JWT 验证每个请求的 CPU 耗时
+
+- legacy：改造前的实现，每次用配置中的 PEM 字符串调用 jwt.decode（每次都要解析公钥）
+- preloaded：使用预先解析好的公钥对象
+- cached：decode_jwt_payload 命中已验证 token 缓存
+- hs256：使用 HS256 签发和验证的 token（未命中缓存）
+
+使用 default.py 中的密钥。用法（在项目根目录下）：python -m benchmarks.jwt_verify [请求次数]
+"""
+import sys
+import time
+
+import jwt
+
+from everyclass.server.user import service as user_service
+from everyclass.server.utils.config import get_config
+
+
+def cpu_per_call(func, number: int) -> float:
+    start = time.process_time()
+    for _ in range(number):
+        func()
+    return (time.process_time() - start) / number * 1000
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    config = get_config()
+    token = jwt.encode({"username": "3901160407"}, config.JWT_PRIVATE_KEY, algorithm='RS256').decode()
+    public_key = user_service._get_jwt_keys('RS256')[1]
+
+    config.JWT_HMAC_SECRET = 'benchmark-secret'
+    hs256_token = jwt.encode({"username": "3901160407"}, config.JWT_HMAC_SECRET, algorithm='HS256').decode()
+
+    candidates = {
+        'legacy': lambda: jwt.decode(token, config.JWT_PUBLIC_KEY, algorithms=['RS256']),
+        'preloaded': lambda: jwt.decode(token, public_key, algorithms=['RS256']),
+        'cached': lambda: user_service.decode_jwt_payload(token),
+        'hs256': lambda: jwt.decode(hs256_token, config.JWT_HMAC_SECRET, algorithms=['HS256']),
+    }
+    for name, func in candidates.items():
+        assert func()['username'] == '3901160407'
+        print(f"{name:>9}: {cpu_per_call(func, number):.4f} ms CPU/request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+对比 session 改造前后每个请求的额外开销
+
+改造前的实现（每个请求都解密、pickle 反序列化，并在响应时重新加密写回 cookie）在这里保留了一份用作基准。
+
+用法（在项目根目录下）：python -m benchmarks.session_overhead [请求次数]
+"""
+import base64
+import pickle
+import sys
+import timeit
+import zlib
+
+from Crypto.Cipher import AES
+from flask import Flask, session
+
+from everyclass.server.utils.session import EncryptedSession, EncryptedSessionInterface, UserSession
+
+CRYPTO_KEY = b'0123456789abcdef0123456789abcdef'
+
+
+class EagerPickleSessionInterface(EncryptedSessionInterface):
+    """改造前的行为"""
+
+    def open_session(self, app, request):
+        itup = request.cookies.get(self.session_cookie_name, '').split(".")
+        if len(itup) != 4:
+            return EncryptedSession()
+        ciphertext, mac, nonce = (base64.b64decode(part) for part in itup[1:])
+        data = AES.new(CRYPTO_KEY, AES.MODE_EAX, nonce).decrypt_and_verify(ciphertext, mac)
+        return EncryptedSession(pickle.loads(zlib.decompress(data) if itup[0] == 'z' else data))
+
+    def save_session(self, app, session, response):
+        if not session:
+            return
+        cipher = AES.new(CRYPTO_KEY, AES.MODE_EAX)
+        ciphertext, mac = cipher.encrypt_and_digest(pickle.dumps(dict(session)))
+        response.set_cookie(self.session_cookie_name, ".".join(
+            ['u'] + [base64.b64encode(part).decode() for part in (ciphertext, mac, cipher.nonce)]), httponly=True)
+
+
+def make_app(interface) -> Flask:
+    app = Flask(__name__)
+    app.config['SESSION_CRYPTO_KEY'] = CRYPTO_KEY
+    app.session_interface = interface
+
+    @app.route('/login')
+    def login():
+        session['user_id'] = 10000
+        session['current_user'] = UserSession('student', '3901160407', 'student;abcdef', '张三')
+        return ''
+
+    @app.route('/read')
+    def read():
+        return session['current_user'].name
+
+    @app.route('/static')
+    def static_file():
+        return ''
+
+    return app
+
+
+def main(number: int = 2000):
+    for name, interface in (('before', EagerPickleSessionInterface()), ('after', EncryptedSessionInterface())):
+        client = make_app(interface).test_client()
+        client.get('/login')
+        for path in ('/static', '/read'):
+            seconds = min(timeit.repeat(lambda: client.get(path), number=number, repeat=3)) / number
+            print(f"{name:>6} {path:>8}: {seconds * 1e6:.1f} us per request")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
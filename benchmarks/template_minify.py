@@ -0,0 +1,101 @@
+"""
+对比学生课表页面在两种压缩方式下的渲染 CPU 和响应耗时
+
+- response：改造前的方式，模板原样渲染，after_request 中对整个响应执行 htmlmin
+- template：模板加载时去掉缩进和空行（WhitespaceStripExtension），响应不再处理
+
+用法（在项目根目录下）：python -m benchmarks.template_minify [请求次数]
+"""
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict, namedtuple
+
+from flask import Flask, render_template
+from htmlmin import minify
+from markupsafe import Markup
+
+from everyclass.server.utils import web_consts
+from everyclass.server.utils.template_minify import WhitespaceStripExtension
+
+TEMPLATE_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), '../frontend/templates'))
+ENDPOINTS = ('query.get_teacher', 'query.get_classroom', 'query.get_card', 'query.available_rooms',
+             'query.multi_people_schedule', 'main.guide', 'main.about', 'user.main', 'user.login', 'calendar.cal_page')
+
+Student = namedtuple('Student', 'name deputy klass student_id student_id_encoded remark semesters')
+Teacher = namedtuple('Teacher', 'name title teacher_id_encoded')
+Card = namedtuple('Card', 'name teachers week_string room room_id_encoded card_id_encoded lesson')
+
+
+def make_cards():
+    """一份典型的学生课表：工作日每天 4 节课，每节两门课程"""
+    cards = defaultdict(list)
+    for day in range(1, 6):
+        for time_ in range(1, 5):
+            for i in range(2):
+                cards[(day, time_)].append(Card(f'课程{day}{time_}{i}',
+                                                [Teacher('张三', '教授', 'teacher;abcdef'), Teacher('李四', '讲师', 'teacher;123456')],
+                                                '1-16/全周', 'A座101', 'room;abcdef', 'klass;abcdef', f'{day}{time_}02'))
+    return cards
+
+
+def make_app(mode: str) -> Flask:
+    app = Flask(__name__, template_folder=TEMPLATE_FOLDER)
+    app.config.update(CONFIG_NAME='benchmark', GIT_DESCRIBE='v1.0', DATA_LAST_UPDATE_TIME='2020 年 1 月 1 日',
+                      FEATURE_GATING={'user': True})
+    app.add_template_filter(lambda filename: filename, 'versioned')
+    app.context_processor(lambda: dict(consts=web_consts, api_base_url=''))
+    for endpoint in ENDPOINTS:
+        app.add_url_rule(f'/{endpoint}/<path:args>', endpoint, lambda **kwargs: '')
+    app.url_build_error_handlers.append(lambda error, endpoint, values: f'/{endpoint}')
+
+    if mode == 'template':
+        app.jinja_env.add_extension(WhitespaceStripExtension)
+    else:
+        @app.after_request
+        def response_minify(response):
+            if response.content_type == u'text/html; charset=utf-8':
+                response.set_data(minify(response.get_data(as_text=True)))
+            return response
+
+    student = Student('张三', '计算机学院', '计科1601', '3901160101', 'student;abcdef', '', ['2019-2020-1'])
+    cards = make_cards()
+
+    @app.route('/student')
+    def get_student():
+        timetable = render_template('entity/_timetable.html', resource_type='student', cards=cards, empty_sat=True,
+                                    empty_sun=True, empty_6=True, empty_5=False, current_semester='2019-2020-1')
+        return render_template('entity/student.html', have_semesters=True, student=student, timetable=Markup(timetable),
+                               available_semesters=[('2019-2020-1', True)], current_semester='2019-2020-1')
+
+    return app
+
+
+def run(mode: str, number: int) -> None:
+    client = make_app(mode).test_client()
+    response = client.get('/student')  # 预热，同时加载模板
+    assert response.status_code == 200
+    size = len(response.data)
+
+    latencies = []
+    cpu_start = time.process_time()
+    for _ in range(number):
+        start = time.perf_counter()
+        client.get('/student')
+        latencies.append((time.perf_counter() - start) * 1000)
+    cpu = (time.process_time() - cpu_start) * 1000 / number
+
+    latencies.sort()
+    print(f"{mode:>8}: {size} bytes, cpu {cpu:.3f} ms/req, "
+          f"p50 {statistics.median(latencies):.3f} ms, p99 {latencies[int(number * 0.99) - 1]:.3f} ms")
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    for mode in ('response', 'template'):
+        run(mode, number)
+
+
+if __name__ == '__main__':
+    main()
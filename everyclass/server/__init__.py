@@ -7,7 +7,6 @@ from ddtrace import tracer
 from flask import Flask, g, render_template, request, session
 from flask_cdn import CDN
 from flask_moment import Moment
-from htmlmin import minify
 from raven.contrib.flask import Sentry
 from raven.handlers.logging import SentryHandler
 
@@ -34,6 +33,14 @@ try:
         gc.set_threshold(700)
 
 
+    @uwsgidecorators.postfork
+    def start_process_pool():
+        """启动用于密码哈希等 CPU 密集任务的进程池。需要在其他线程启动之前 fork 子进程"""
+        from everyclass.server.utils.concurrency import start_process_pool as start
+
+        start()
+
+
     @uwsgidecorators.postfork
     def init_plugins():
         """初始化日志、错误追踪、打点插件"""
@@ -69,6 +76,14 @@ try:
         init_pg()
 
 
+    @uwsgidecorators.postfork
+    def start_ics_workers():
+        """启动 ics 文件后台生成线程"""
+        from everyclass.server.calendar.service import start_ics_workers as start
+
+        start(__app)
+
+
     @uwsgidecorators.postfork
     def fetch_remote_manifests():
         """
@@ -103,7 +118,17 @@ def cron_update_remote_manifest():
                                       url=__app.config['ENTITY_BASE_URL'] + '/info/service',
                                       retry=True,
                                       headers={'X-Auth-Token': __app.config['ENTITY_TOKEN']})
-    __app.config['DATA_LAST_UPDATE_TIME'] = _api_server_status["data"]["data_time"]
+    data_time = _api_server_status["data"]["data_time"]
+    if data_time != __app.config['DATA_LAST_UPDATE_TIME']:
+        __app.config['DATA_LAST_UPDATE_TIME'] = data_time
+
+        # 数据更新后预先生成最近使用过的日历文件
+        from everyclass.server.calendar.service import enqueue_recently_used
+        try:
+            with __app.app_context():
+                enqueue_recently_used()
+        except Exception as e:
+            logger.warning("failed to enqueue ics pre-generation jobs", extra={"error": repr(e)})
 
 
 def create_app() -> Flask:
@@ -193,7 +218,9 @@ def create_app() -> Flask:
         from everyclass.server.utils.web_consts import SESSION_CURRENT_USER, SESSION_USER_SEQ
         from everyclass.server.user import service as user_service
 
-        if not session.get('user_id', None) and request.endpoint not in ("main.health_check", "static"):
+        if request.endpoint in ("main.health_check", "static"):
+            return  # 不访问 session，避免解密 cookie
+        if not session.get('user_id', None):
             logger.info(f"Give a new user ID for new user. endpoint: {request.endpoint}")
             session['user_id'] = user_service.get_user_id()
         if session.get('user_id', None):
@@ -206,11 +233,18 @@ def create_app() -> Flask:
         """日志中记录请求"""
         logger.info(f'Request received: {request.method} {request.path}')
 
+    if app.config['HTML_MINIFY']:
+        # 在模板加载时压缩 HTML，渲染时没有额外开销
+        from everyclass.server.utils.template_minify import WhitespaceStripExtension
+        app.jinja_env.add_extension(WhitespaceStripExtension)
+
     @app.after_request
-    def response_minify(response):
-        """用 htmlmin 压缩 HTML，减轻带宽压力"""
-        if app.config['HTML_MINIFY'] and response.content_type == u'text/html; charset=utf-8':
-            response.set_data(minify(response.get_data(as_text=True)))
+    def response_minify_verify(response):
+        """抽样统计加载时压缩之后 htmlmin 还能节省多少字节，不修改响应"""
+        if app.config['HTML_MINIFY_VERIFY_RATE'] and response.content_type == u'text/html; charset=utf-8' \
+                and not response.direct_passthrough:
+            from everyclass.server.utils.template_minify import verify_sampled
+            verify_sampled(response.get_data(as_text=True), app.config['HTML_MINIFY_VERIFY_RATE'])
         return response
 
     from everyclass.server.utils.db.postgres import db_session
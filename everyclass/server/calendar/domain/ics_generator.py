@@ -2,10 +2,12 @@
 This is module to generate .ics file. Should follow RFC2445 standard.
 https://tools.ietf.org/html/rfc2445
 """
+import functools
 import hashlib
 import os
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 import pytz
 from ddtrace import tracer
@@ -14,17 +16,16 @@ from icalendar import Alarm, Calendar, Event, Timezone, TimezoneStandard
 
 from everyclass.common.env import get_env
 from everyclass.common.time import get_time
+from everyclass.server.calendar.domain import ics_writer
+from everyclass.server.calendar.domain.ics_writer import EventFields
+from everyclass.server.entity.domain import get_semester_calendar
 from everyclass.server.entity.model import Semester
+from everyclass.server.utils.cache import data_version
 from everyclass.server.utils.config import get_config
 
-tzc = Timezone()
-tzc.add('tzid', 'Asia/Shanghai')
-tzc.add('x-lic-location', 'Asia/Shanghai')
-tzs = TimezoneStandard()
-tzs.add('tzname', 'CST')
-tzs.add('dtstart', datetime(1970, 1, 1, 0, 0, 0))
-tzs.add('TZOFFSETFROM', timedelta(hours=8))
-tzs.add('TZOFFSETTO', timedelta(hours=8))
+_TZ = pytz.timezone("Asia/Shanghai")
+
+ICS_FORMAT_VERSION = 1  # 修改生成规则时加一，使已生成的文件全部失效
 
 
 def generate(name: str, cards: Dict[Tuple[int, int], List[Dict]], semester: Semester, filename: str) -> None:
@@ -39,115 +40,166 @@ def generate(name: str, cards: Dict[Tuple[int, int], List[Dict]], semester: Seme
     """
     from everyclass.server import statsd
 
-    with tracer.trace("calendar_init"):
-        semester_string = semester.to_str(simplify=True)
-        semester = semester.to_tuple()
-
-        # 创建 calender 对象
-        cal = Calendar()
-        cal.add('prodid', '-//Admirable//EveryClass//EN')
-        cal.add('version', '2.0')
-        cal.add('calscale', 'GREGORIAN')
-        cal.add('method', 'PUBLISH')
-        cal.add('X-WR-CALNAME', name + '的' + semester_string + '课表')
-        cal.add('X-WR-TIMEZONE', 'Asia/Shanghai')
-
-        # 时区
-        tzc.add_component(tzs)
-        cal.add_component(tzc)
+    calendar_name = name + '的' + semester.to_str(simplify=True) + '课表'
+    last_modified = datetime.now()
 
     with tracer.trace("add_events"):
-        # 创建 events
-        for time in range(1, 7):
-            for day in range(1, 8):
-                if (day, time) in cards:
-                    for card in cards[(day, time)]:
-                        for week in card['week']:
-                            dtstart = _get_datetime(week, day, get_time(time)[0], semester)
-                            dtend = _get_datetime(week, day, get_time(time)[1], semester)
-
-                            if dtstart.year == 1984:
-                                continue
-
-                            cal.add_component(_build_event(card_name=card['name'],
-                                                           times=(dtstart, dtend),
-                                                           classroom=card['classroom'],
-                                                           teacher=card['teacher'],
-                                                           week_string=card['week_string'],
-                                                           current_week=week,
-                                                           cid=card['cid']))
+        events = list(_iter_events(cards, semester.to_tuple()))
+
+    with tracer.trace("serialize"):
+        if get_config().ICS_SERIALIZER == 'fast':
+            data = ics_writer.serialize(calendar_name, _TZ.zone, events, last_modified)
+        else:
+            data = _build_calendar(calendar_name, events, last_modified).to_ical()
+        statsd.histogram('calendar.ics.generate.size', len(data))
 
     with tracer.trace("write_file"):
-        with open(os.path.join(calendar_dir(), filename), 'wb') as f:
-            data = cal.to_ical()
-            statsd.histogram('calendar.ics.generate.size', len(data))
+        # 先写入临时文件再替换，避免正在下载的请求读到写了一半的文件
+        with tempfile.NamedTemporaryFile(dir=calendar_dir(), suffix='.tmp', delete=False) as f:
             f.write(data)
+        os.chmod(f.name, 0o644)
+        os.replace(f.name, os.path.join(calendar_dir(), filename))
 
 
-def _get_datetime(week: int, day: int, time: Tuple[int, int], semester: Tuple[int, int, int]) -> datetime:
+def content_digest(name: str, cards: Dict[Tuple[int, int], List[Dict]], semester: Semester) -> str:
     """
-    根据学期、周次、时间，生成 `datetime` 类型的时间
+    计算 ics 文件内容的摘要。摘要只取决于姓名、课程、学期及其调课规则和生成规则版本，摘要不变则生成的文件内容不变
 
-    :param week: 周次
-    :param day: 星期
-    :param time: 时间tuple（时,分）
+    :param name: 姓名
+    :param cards: 参与的课程
     :param semester: 学期
+    :return: 十六进制的 sha256 摘要
+    """
+    normalized_cards = sorted((day_time, card['cid'], card['name'], card['classroom'], card['teacher'],
+                               tuple(card['week']), card['week_string'])
+                              for day_time, cards_at_time in cards.items() for card in cards_at_time)
+    adjustments = get_config().AVAILABLE_SEMESTERS.get(semester.to_tuple(), {}).get('adjustments', {})
+    payload = repr((ICS_FORMAT_VERSION, name, semester.to_tuple(), normalized_cards, sorted(adjustments.items())))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cache_version() -> str:
+    """已生成文件的缓存版本。数据版本、生成规则或调课规则变化后，需要重新计算摘要确认文件内容是否变化"""
+    return f"{data_version()}:{ICS_FORMAT_VERSION}:{_semesters_fingerprint()}"
+
+
+@functools.lru_cache()
+def _semesters_fingerprint() -> str:
+    return hashlib.md5(repr(get_config().AVAILABLE_SEMESTERS).encode('utf-8')).hexdigest()[:8]
+
+
+def _iter_events(cards: Dict[Tuple[int, int], List[Dict]], semester: Tuple[int, int, int]) -> Iterator[EventFields]:
+    """按上课时间顺序生成每节课的事件字段"""
+    semester_calendar = get_semester_calendar()
+    for time in range(1, 7):
+        for day in range(1, 8):
+            if (day, time) in cards:
+                for card in cards[(day, time)]:
+                    for week in card['week']:
+                        lesson_date = semester_calendar.lesson_date(semester, week, day)
+                        if not lesson_date:
+                            # 这天的课被放掉了
+                            continue
+                        dtstart = _get_datetime(lesson_date, get_time(time)[0])
+                        dtend = _get_datetime(lesson_date, get_time(time)[1])
+
+                        yield _event_fields(card_name=card['name'],
+                                            times=(dtstart, dtend),
+                                            classroom=card['classroom'],
+                                            teacher=card['teacher'],
+                                            week_string=card['week_string'],
+                                            current_week=week,
+                                            cid=card['cid'])
+
+
+def _get_datetime(lesson_date: date, time: Tuple[int, int]) -> datetime:
+    """
+    根据上课日期和时间，生成 `datetime` 类型的时间
+
+    :param lesson_date: 上课日期（已应用调课规则）
+    :param time: 时间tuple（时,分）
     :return: datetime 类型的时间
     """
-    config = get_config()
-    tz = pytz.timezone("Asia/Shanghai")
-    dt = datetime(*(config.AVAILABLE_SEMESTERS[semester]['start'] + time), tzinfo=tz)  # noqa: T484
-    dt += timedelta(days=(week - 1) * 7 + day)  # 调整到当前周
-
-    if 'adjustments' in config.AVAILABLE_SEMESTERS[semester]:
-        ymd = (dt.year, dt.month, dt.day)
-        adjustments = config.AVAILABLE_SEMESTERS[semester]['adjustments']
-        if ymd in adjustments:
-            if adjustments[ymd]['to']:
-                # 调课
-                dt = dt.replace(year=adjustments[ymd]['to'][0],
-                                month=adjustments[ymd]['to'][1],
-                                day=adjustments[ymd]['to'][2])
-            else:
-                # 冲掉的课年份设置为1984，返回之后被抹去
-                dt = dt.replace(year=1984)
-
-    return dt
-
-
-def _build_event(card_name: str, times: Tuple[datetime, datetime], classroom: str, teacher: str, current_week: int,
-                 week_string: str, cid: str) -> Event:
+    return datetime(lesson_date.year, lesson_date.month, lesson_date.day, *time, tzinfo=_TZ)
+
+
+def _event_fields(card_name: str, times: Tuple[datetime, datetime], classroom: str, teacher: str, current_week: int,
+                  week_string: str, cid: str) -> EventFields:
     """
-    生成 `Event` 对象
+    计算一个事件的各个字段，两种序列化方式共用
 
     :param card_name: 课程名
     :param times: 开始和结束时间
     :param classroom: 课程地点
     :param teacher: 任课教师
-    :return: `Event` 对象
+    :return: `EventFields` 对象
     """
-
-    event = Event()
-    event.add('transp', 'TRANSPARENT')
     summary = card_name
+    location = ''
     if classroom != 'None':
         summary = card_name + '@' + classroom
-        event.add('location', classroom)
+        location = classroom
 
     description = week_string
     if teacher != 'None':
         description += '\n教师：' + teacher
     description += '\n由 EveryClass 每课 (https://everyclass.xyz) 导入'
 
-    event.add('summary', summary)
-    event.add('description', description)
-    event.add('dtstart', times[0])
-    event.add('dtend', times[1])
-    event.add('last-modified', datetime.now())
-
     # 使用"cid-当前周"作为事件的超码
     event_sk = cid + '-' + str(current_week)
-    event['uid'] = hashlib.md5(event_sk.encode('utf-8')).hexdigest() + '@everyclass.xyz'
+    uid = hashlib.md5(event_sk.encode('utf-8')).hexdigest() + '@everyclass.xyz'
+    return EventFields(summary=summary, dtstart=times[0], dtend=times[1], uid=uid, description=description,
+                       location=location)
+
+
+def _build_calendar(calendar_name: str, events: Iterable[EventFields], last_modified: datetime) -> Calendar:
+    """使用 icalendar 构造 `Calendar` 对象"""
+    cal = Calendar()
+    cal.add('prodid', '-//Admirable//EveryClass//EN')
+    cal.add('version', '2.0')
+    cal.add('calscale', 'GREGORIAN')
+    cal.add('method', 'PUBLISH')
+    cal.add('X-WR-CALNAME', calendar_name)
+    cal.add('X-WR-TIMEZONE', 'Asia/Shanghai')
+
+    # 时区。每次新建对象，避免重复添加 STANDARD 子组件
+    tzc = Timezone()
+    tzc.add('tzid', 'Asia/Shanghai')
+    tzc.add('x-lic-location', 'Asia/Shanghai')
+    tzs = TimezoneStandard()
+    tzs.add('tzname', 'CST')
+    tzs.add('dtstart', datetime(1970, 1, 1, 0, 0, 0))
+    tzs.add('TZOFFSETFROM', timedelta(hours=8))
+    tzs.add('TZOFFSETTO', timedelta(hours=8))
+    tzc.add_component(tzs)
+    cal.add_component(tzc)
+
+    for fields in events:
+        cal.add_component(_build_event(fields, last_modified))
+    return cal
+
+
+def _build_event(fields: EventFields, last_modified: datetime) -> Event:
+    """
+    生成 `Event` 对象
+
+    :param fields: 事件字段
+    :param last_modified: 最后修改时间
+    :return: `Event` 对象
+    """
+
+    event = Event()
+    event.add('transp', 'TRANSPARENT')
+    if fields.location:
+        event.add('location', fields.location)
+
+    event.add('summary', fields.summary)
+    event.add('description', fields.description)
+    event.add('dtstart', fields.dtstart)
+    event.add('dtend', fields.dtend)
+    event.add('last-modified', last_modified)
+    event['uid'] = fields.uid
+
     alarm = Alarm()
     alarm.add('action', 'none')
     alarm.add('trigger', datetime(1980, 1, 1, 3, 5, 0))
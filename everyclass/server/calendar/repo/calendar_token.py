@@ -1,10 +1,13 @@
 import datetime
-import time
 import uuid
-from typing import overload, Union, Dict, Optional
+from typing import overload, Union, Dict, List, Optional, Tuple
 
+from psycopg2.extras import execute_values
+
+from everyclass.server.utils.batching import BufferedWriter
+from everyclass.server.utils.cache import MISSING, TwoTierCache
+from everyclass.server.utils.config import get_config
 from everyclass.server.utils.db import pg_conn_context
-from everyclass.server.utils.db.redis import redis, redis_prefix
 
 
 def insert_calendar_token(resource_type: str, semester: str, identifier: str) -> str:
@@ -25,34 +28,69 @@ def insert_calendar_token(resource_type: str, semester: str, identifier: str) ->
         """
         cursor.execute(insert_query, (resource_type, identifier, semester, token, datetime.datetime.now()))
         conn.commit()
+
+    doc = {"type": resource_type, "identifier": identifier, "semester": semester, "token": str(token)}
+    _token_cache.set(_token_key(str(token)), doc)
+    _owner_cache.set(_owner_key(resource_type, identifier, semester), doc)  # 覆盖 reset_tokens 写入的删除标记
     return str(token)
 
 
 def update_last_used_time(token: str):
-    """更新token最后使用时间"""
+    """更新token最后使用时间。写入先进入缓冲区，由后台线程定期批量写入数据库"""
+    _last_used_writer.put(token, datetime.datetime.now())
+
+
+def _flush_last_used_time(batch: Dict[str, datetime.datetime]) -> None:
+    """批量更新token最后使用时间"""
     with pg_conn_context() as conn, conn.cursor() as cursor:
-        insert_query = """
-        UPDATE calendar_tokens SET last_used_time = %s WHERE token = %s;
+        update_query = """
+        UPDATE calendar_tokens AS t SET last_used_time = v.last_used_time
+            FROM (VALUES %s) AS v (token, last_used_time) WHERE t.token = v.token;
         """
-        cursor.execute(insert_query, (datetime.datetime.now(), uuid.UUID(token)))
+        # 按 token 排序，避免不同进程同时更新相同的行时死锁
+        execute_values(cursor, update_query, sorted(batch.items()), template="(%s::uuid, %s::timestamptz)")
         conn.commit()
 
 
+_last_used_writer = BufferedWriter("calendar_token_last_used", _flush_last_used_time,
+                                   interval=get_config().CALENDAR_TOKEN_FLUSH_INTERVAL,
+                                   max_batch=get_config().CALENDAR_TOKEN_FLUSH_BATCH)
+
+
+def find_recently_used_tokens(since: datetime.datetime) -> List[Tuple[str, str, str, datetime.datetime]]:
+    """查找某个时间之后使用过的令牌，返回 (类型, 学号或教工号, 学期, 最后使用时间) 列表，最近使用的在前"""
+    with pg_conn_context() as conn, conn.cursor() as cursor:
+        select_query = """
+        SELECT type, identifier, semester, last_used_time FROM calendar_tokens
+            WHERE last_used_time > %s ORDER BY last_used_time DESC;
+        """
+        cursor.execute(select_query, (since,))
+        return cursor.fetchall()
+
+
 def reset_tokens(student_id: str, typ: Optional[str] = "student") -> None:
     """删除某用户所有的 token，默认为学生"""
     with pg_conn_context() as conn, conn.cursor() as cursor:
         insert_query = """
-        DELETE FROM calendar_tokens WHERE identifier = %s AND type = %s;
+        DELETE FROM calendar_tokens WHERE identifier = %s AND type = %s RETURNING token, semester;
         """
         cursor.execute(insert_query, (student_id, typ))
+        deleted = cursor.fetchall()
         conn.commit()
 
+    # 写入删除标记而不是删除缓存：并发的读取者可能在 DELETE 提交前读到了旧令牌，它随后的回填（SET NX）不会覆盖删除标记。
+    # 删除标记与正常条目的过期时间相同，保证旧令牌不会在标记过期后被回填。令牌归属只缓存在 Redis 中，所有进程立即看到删除标记；
+    # 按令牌查询的进程内缓存不会被清除，其他进程最多在 CALENDAR_TOKEN_LOCAL_TTL 秒内仍然接受旧令牌
+    for token, semester in deleted:
+        _token_cache.set(_token_key(str(token)), None)
+        _owner_cache.set(_owner_key(typ, student_id, semester), None)
+
 
 def _parse(result):
     return {"type": result[0],
             "identifier": result[1],
             "semester": result[2],
-            "token": result[3]}
+            "token": str(result[3])}
 
 
 @overload  # noqa: F811
@@ -71,65 +109,73 @@ def find_calendar_token(sid: str, semester: str) -> Union[Dict, None]:
 
 
 def find_calendar_token(tid=None, sid=None, semester=None, token=None):
-    """通过 token 或者 sid/tid + 学期获得 token 文档"""
-    with pg_conn_context() as conn, conn.cursor() as cursor:
-        if token:
-            select_query = """
-            SELECT type, identifier, semester, token, create_time, last_used_time FROM calendar_tokens
-                WHERE token=%s
-            """
-            cursor.execute(select_query, (uuid.UUID(token),))
-            result = cursor.fetchall()
-            return _parse(result[0]) if result else None
-        elif (tid or sid) and semester:
-            select_query = """
-            SELECT type, identifier, semester, token, create_time, last_used_time FROM calendar_tokens
-                WHERE type=%s AND identifier=%s AND semester=%s;
-            """
-            cursor.execute(select_query, ("teacher" if tid else "student", tid, semester))
-            result = cursor.fetchall()
-            return _parse(result[0]) if result else None
-        else:
-            raise ValueError("tid/sid together with semester or token must be given to search a token document")
-
-
-SECONDS_IN_HOUR = 60 * 60
-SECONDS_IN_DAY = 60 * 60 * 24
-
-
-def use_cache(filename: str) -> bool:
     """
-    漏桶算法决定是否使用缓存好了的文件。目前规则为一小时内第2次刷新则不使用缓存，另外每24小时会强制更新一次
+    通过 token 或者 sid/tid + 学期获得 token 文档。结果会被缓存，不存在的 token 也会被缓存一段较短的时间。
 
-    :param filename: ics文件名
-    :return: 表示是否使用缓存的布尔值
+    缓存未命中时使用 SET NX 回填，不覆盖 insert_calendar_token 写入的新令牌和 reset_tokens 写入的删除标记（None）。
+    按 sid/tid 查询时删除标记视为未命中，调用方随后插入的新令牌会覆盖删除标记。
     """
-
-    def set_current():
-        redis.set(key, f"{str(int(time.time()))},1")
-
-    key = f"{redis_prefix}:cal_tkn:{filename}"
-    r = redis.get(key)
-    if not r:
-        set_current()
-        return True
-
-    timestamp, times = map(int, r.decode().split(","))
-
-    if int(time.time()) - timestamp < SECONDS_IN_HOUR:  # 周期内，根据次数判断
-        if times - 1 == 0:
-            # 周期内缓存次数用完
-            set_current()
-            return False
-        else:
-            # 缓存次数没用完
-            redis.set(key, f"{str(timestamp)},{str(times - 1)}")
-            return True
+    if token:
+        key = _token_key(token)
+        doc = _token_cache.get(key)
+        if doc is MISSING:
+            doc = _select_by_token(token)
+            if not _token_cache.add(key, doc, ttl=None if doc else get_config().CALENDAR_TOKEN_NEGATIVE_TTL):
+                doc = _reread(_token_cache, key, doc)
+        return doc
+    elif (tid or sid) and semester:
+        resource_type = "teacher" if tid else "student"
+        key = _owner_key(resource_type, tid or sid, semester)
+        doc = _owner_cache.get(key)
+        if doc is MISSING or doc is None:
+            # 读到删除标记时 DELETE 已经提交，此后查到的只可能是新插入的令牌，不需要再以缓存为准
+            after_reset = doc is None
+            doc = _select_by_owner(resource_type, tid or sid, semester)
+            # 不缓存不存在的情况，调用方随后会插入新的 token
+            if doc and not _owner_cache.add(key, doc) and not after_reset:
+                doc = _reread(_owner_cache, key, doc)
+        return doc
     else:
-        if int(time.time()) - timestamp > SECONDS_IN_DAY:
-            # 超过一天，不使用缓存
-            set_current()
-            return False
-        # 未超过一天，可使用缓存
-        set_current()
-        return True
+        raise ValueError("tid/sid together with semester or token must be given to search a token document")
+
+
+def _reread(cache: TwoTierCache, key: str, doc: Optional[Dict]) -> Optional[Dict]:
+    """回填失败说明读数据库期间有并发的写入，以缓存中的值（新令牌或删除标记）为准"""
+    cached = cache.get_remote(key)
+    return doc if cached is MISSING else cached
+
+
+def _select_by_token(token: str) -> Optional[Dict]:
+    with pg_conn_context() as conn, conn.cursor() as cursor:
+        select_query = """
+        SELECT type, identifier, semester, token, create_time, last_used_time FROM calendar_tokens
+            WHERE token=%s
+        """
+        cursor.execute(select_query, (uuid.UUID(token),))
+        result = cursor.fetchall()
+        return _parse(result[0]) if result else None
+
+
+def _select_by_owner(resource_type: str, identifier: str, semester: str) -> Optional[Dict]:
+    with pg_conn_context() as conn, conn.cursor() as cursor:
+        select_query = """
+        SELECT type, identifier, semester, token, create_time, last_used_time FROM calendar_tokens
+            WHERE type=%s AND identifier=%s AND semester=%s;
+        """
+        cursor.execute(select_query, (resource_type, identifier, semester))
+        result = cursor.fetchall()
+        return _parse(result[0]) if result else None
+
+
+def _token_key(token: str) -> str:
+    return f"token:{uuid.UUID(token)}"
+
+
+def _owner_key(resource_type: str, identifier: str, semester: str) -> str:
+    return f"owner:{resource_type}:{identifier}:{semester}"
+
+
+_token_cache = TwoTierCache("calendar_token", get_config().CALENDAR_TOKEN_CACHE_LOCAL_SIZE, get_config().CALENDAR_TOKEN_CACHE_TTL,
+                            local_ttl=get_config().CALENDAR_TOKEN_LOCAL_TTL)
+# 令牌归属只在生成订阅链接时查询，不使用进程内缓存（大小为 0），重置令牌后其他进程不会再返回已删除的令牌
+_owner_cache = TwoTierCache("calendar_token", 0, get_config().CALENDAR_TOKEN_CACHE_TTL)
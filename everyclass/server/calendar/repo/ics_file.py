@@ -0,0 +1,41 @@
+from typing import NamedTuple, Optional
+
+from everyclass.server.utils.db.redis import redis, redis_prefix
+
+META_TTL = 60 * 60 * 24 * 30  # 一个月未被访问的文件元数据自动过期，过期后访问会重新计算摘要
+
+
+class IcsFileMeta(NamedTuple):
+    digest: str  # 文件内容摘要，同时用作 ETag
+    version: str  # 生成或上次校验摘要时的缓存版本（数据版本 + 生成规则版本）
+    last_modified: float  # 内容最后一次变化的时间戳
+
+
+def _key(filename: str) -> str:
+    return f"{redis_prefix}:ics_file:{filename}"
+
+
+def get_file_meta(filename: str) -> Optional[IcsFileMeta]:
+    """获取 ics 文件的元数据，不存在时返回 None"""
+    meta = redis.hgetall(_key(filename))
+    if not meta:
+        return None
+    return IcsFileMeta(digest=meta[b'digest'].decode(),
+                       version=meta[b'version'].decode(),
+                       last_modified=float(meta[b'last_modified']))
+
+
+def set_file_meta(filename: str, meta: IcsFileMeta) -> None:
+    """写入 ics 文件的元数据"""
+    with redis.pipeline() as pipe:
+        pipe.hset(_key(filename), mapping=meta._asdict())
+        pipe.expire(_key(filename), META_TTL)
+        pipe.execute()
+
+
+def update_file_version(filename: str, version: str) -> None:
+    """内容摘要未变化时，只更新校验时的缓存版本"""
+    with redis.pipeline() as pipe:
+        pipe.hset(_key(filename), 'version', version)
+        pipe.expire(_key(filename), META_TTL)
+        pipe.execute()
@@ -0,0 +1,46 @@
+"""
+ics 文件后台生成队列
+
+队列为 Redis 中的有序集合，成员为 "类型:学号或教工号:学期"，分数为令牌最近一次使用的时间戳，分数越大越先生成。
+同一文件重复入队只会更新分数，不会重复生成。
+"""
+from typing import Iterable, Optional, Tuple
+
+from everyclass.server.utils.db.redis import redis, redis_prefix
+
+QUEUE_KEY = f"{redis_prefix}:ics_queue"
+
+
+def _member(type_: str, identifier: str, semester: str) -> str:
+    return f"{type_}:{identifier}:{semester}"
+
+
+def push_jobs(jobs: Iterable[Tuple[str, str, str, float]]) -> int:
+    """
+    批量入队
+
+    :param jobs: (类型, 学号或教工号, 学期, 优先级) 元组
+    :return: 新加入队列的任务数
+    """
+    mapping = {_member(type_, identifier, semester): priority for type_, identifier, semester, priority in jobs}
+    if not mapping:
+        return 0
+    return redis.zadd(QUEUE_KEY, mapping)
+
+
+def pop_job(timeout: int) -> Optional[Tuple[str, str, str]]:
+    """阻塞地取出优先级最高的任务，超时返回 None"""
+    result = redis.bzpopmax(QUEUE_KEY, timeout=timeout)
+    if not result:
+        return None
+    type_, identifier, semester = result[1].decode().split(":")
+    return type_, identifier, semester
+
+
+def mark_version_enqueued(version: str) -> bool:
+    """标记某个数据版本的预生成任务已入队。返回 False 表示其他进程已经处理过这个版本"""
+    return bool(redis.set(f"{QUEUE_KEY}:version:{version}", 1, nx=True, ex=60 * 60 * 24 * 30))
+
+
+def queue_length() -> int:
+    return redis.zcard(QUEUE_KEY)
@@ -1,9 +1,13 @@
+import datetime
 import os
+import threading
+import time
 from collections import defaultdict
 from typing import Dict, List, Tuple
 from typing import Optional
 
 from ddtrace import tracer
+from redis.exceptions import RedisError
 
 from everyclass.common.time import lesson_string_to_tuple
 from everyclass.rpc.entity import teacher_list_to_name_str
@@ -11,9 +15,14 @@ from everyclass.server import logger
 from everyclass.server.calendar.domain import ics_generator
 from everyclass.server.calendar.domain.ics_generator import calendar_dir
 from everyclass.server.calendar.repo.calendar_token import reset_tokens, find_calendar_token as find_token, insert_calendar_token, \
-    update_last_used_time, use_cache
+    update_last_used_time, find_recently_used_tokens
+from everyclass.server.calendar.repo.ics_file import IcsFileMeta, get_file_meta, set_file_meta, update_file_version
+from everyclass.server.calendar.repo.ics_queue import mark_version_enqueued, pop_job, push_jobs
 from everyclass.server.entity import service as entity_service
 from everyclass.server.entity.model import Semester
+from everyclass.server.utils.config import get_config
+
+_workers_started = False  # 当前进程是否启动了后台生成线程
 
 
 def reset_calendar_tokens(student_id: str, typ: Optional[str] = "student") -> None:
@@ -49,25 +58,54 @@ def find_calendar_token(token: str) -> Optional[Dict]:
     return find_token(token=token)
 
 
-def use_calendar_token(token: str) -> None:
-    update_last_used_time(token)
+def use_calendar_token(token: Dict) -> None:
+    """
+    记录令牌的使用：更新最后使用时间，并以当前时间为优先级将对应的文件放入后台生成队列
+
+    无论文件是否过期都会入队，由后台线程判断是否需要重新生成（未过期时只读取一次元数据）。
+    """
+    update_last_used_time(token["token"])
+    if _workers_started:
+        push_jobs([(token["type"], token["identifier"], token["semester"], time.time())])
+
+
+def get_ics_file(type_: str, identifier: str, semester: str) -> Tuple[str, IcsFileMeta]:
+    """
+    获取可供下载的 ics 文件名及其元数据
+
+    开启后台生成时，如果文件已存在但数据版本已更新，直接返回旧文件，由 use_calendar_token 放入队列的任务刷新；否则同步生成。
+    """
+    if _workers_started:
+        cal_filename = f"{type_}_{identifier}_{semester}.ics"
+        meta = get_file_meta(cal_filename)
+        if meta and os.path.exists(os.path.join(calendar_dir(), cal_filename)):
+            if meta.version != ics_generator.cache_version():
+                from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+
+                statsd.increment("calendar.ics.cache.stale")
+            return cal_filename, meta
+    return generate_ics_file(type_, identifier, semester)
 
 
-def generate_ics_file(type_: str, identifier: str, semester: str) -> str:
-    """生成ics文件并返回文件名"""
+def generate_ics_file(type_: str, identifier: str, semester: str) -> Tuple[str, IcsFileMeta]:
+    """
+    生成ics文件并返回文件名及其元数据（内容摘要、最后修改时间）
+
+    文件以内容摘要作为缓存键：数据版本未变时直接使用已生成的文件；数据版本变化后重新获取课表并计算摘要，摘要不变则不重新生成。
+    """
     from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
 
     cal_filename = f"{type_}_{identifier}_{semester}.ics"
     cal_full_path = os.path.join(calendar_dir(), cal_filename)
-    # 有缓存、且缓存时间小于一天，且不用强刷缓存
-    if os.path.exists(cal_full_path) \
-            and use_cache(cal_filename):
+    version = ics_generator.cache_version()
+
+    meta = get_file_meta(cal_filename)
+    file_exists = os.path.exists(cal_full_path)
+    if meta and meta.version == version and file_exists:
         logger.info("ics cache hit")
         statsd.increment("calendar.ics.cache.hit")
-        return cal_filename
-    statsd.increment("calendar.ics.cache.miss")
+        return cal_filename, meta
 
-    # 无缓存、或需要强刷缓存
     with tracer.trace('rpc'):
         # 获得原始学号或教工号
         if type_ == 'student':
@@ -87,9 +125,57 @@ def generate_ics_file(type_: str, identifier: str, semester: str) -> str:
                                                                    classroom=card.room,
                                                                    cid=card.card_id_encoded))
 
+    digest = ics_generator.content_digest(rpc_result.name, cards, semester)
+    if meta and meta.digest == digest and file_exists:
+        # 数据更新了，但这个人的课表没有变化
+        statsd.increment("calendar.ics.cache.unchanged")
+        update_file_version(cal_filename, version)
+        return cal_filename, meta._replace(version=version)
+    statsd.increment("calendar.ics.cache.miss")
+
     ics_generator.generate(name=rpc_result.name,
                            cards=cards,
                            semester=semester,
                            filename=cal_filename)
 
-    return cal_filename
+    meta = IcsFileMeta(digest=digest, version=version, last_modified=time.time())
+    set_file_meta(cal_filename, meta)
+    return cal_filename, meta
+
+
+def enqueue_recently_used() -> None:
+    """数据版本更新后，将最近使用过的令牌对应的文件放入后台生成队列，越近使用的越先生成。每个版本只会入队一次"""
+    version = ics_generator.cache_version()
+    if not _workers_started or not mark_version_enqueued(version):
+        return
+    since = datetime.datetime.now() - datetime.timedelta(days=get_config().ICS_PREGENERATE_DAYS)
+    count = push_jobs((type_, identifier, semester, last_used_time.timestamp())
+                      for type_, identifier, semester, last_used_time in find_recently_used_tokens(since))
+    logger.info("ics pre-generation jobs enqueued", extra={"version": version, "count": count})
+
+
+def start_ics_workers(app) -> None:
+    """在当前进程中启动后台生成线程"""
+    global _workers_started
+    for i in range(get_config().ICS_WORKER_THREADS):
+        threading.Thread(target=_run_ics_worker, args=(app,), name=f"ics_worker_{i}", daemon=True).start()
+    _workers_started = get_config().ICS_WORKER_THREADS > 0
+
+
+def _run_ics_worker(app) -> None:
+    """不断从队列中取出优先级最高的任务并生成文件。失败的任务不重试，下次使用令牌时会重新入队"""
+    while True:
+        try:
+            job = pop_job(timeout=5)
+        except RedisError as e:
+            logger.warning("ics queue unavailable", extra={"error": repr(e)})
+            time.sleep(5)
+            continue
+        if not job:
+            continue
+
+        try:
+            with app.app_context(), tracer.trace('ics_worker.generate'):
+                generate_ics_file(*job)
+        except Exception as e:
+            logger.warning("ics background generation failed", extra={"job": job, "error": repr(e)})
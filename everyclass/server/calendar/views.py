@@ -12,6 +12,7 @@ from everyclass.server.calendar.domain.ics_generator import calendar_dir
 from everyclass.server.entity import service as entity_service
 from everyclass.server.entity.model import Semester
 from everyclass.server.user import service as user_service
+from everyclass.server.utils.concurrency import ProcessPoolBusy
 from everyclass.server.utils.encryption import decrypt
 from everyclass.server.utils.web_consts import MSG_400, MSG_INVALID_IDENTIFIER
 from everyclass.server.utils.web_helpers import disallow_in_maintenance, handle_exception_with_error_page, check_permission
@@ -70,7 +71,9 @@ def ics_download(calendar_token: str):
     """
     iCalendar ics 文件下载
 
-    2019-8-25 改为预先缓存文件而非每次动态生成，降低 CPU 压力。如果一小时内两次访问则强刷缓存。
+    2019-8-25 改为预先缓存文件而非每次动态生成，降低 CPU 压力。
+    文件按内容摘要缓存，课表内容变化时才重新生成。响应带有 ETag 和 Last-Modified，内容未变时返回 304。
+    数据更新后先返回旧文件，由后台线程重新生成。
     """
     if not is_valid_uuid(calendar_token):
         return 'invalid calendar token', 404
@@ -78,12 +81,19 @@ def ics_download(calendar_token: str):
     result = calendar_service.find_calendar_token(token=calendar_token)
     if not result:
         return 'invalid calendar token', 404
-    calendar_service.use_calendar_token(calendar_token)
+    calendar_service.use_calendar_token(result)
 
-    return send_from_directory(calendar_dir(),
-                               calendar_service.generate_ics_file(result["type"], result["identifier"], result["semester"]),
-                               as_attachment=True,
-                               mimetype='text/calendar')
+    filename, meta = calendar_service.get_ics_file(result["type"], result["identifier"], result["semester"])
+    response = send_from_directory(calendar_dir(),
+                                   filename,
+                                   as_attachment=True,
+                                   mimetype='text/calendar',
+                                   add_etags=False,
+                                   conditional=False,
+                                   last_modified=meta.last_modified)
+    # 设置 ETag 之后再统一处理条件请求，保证 If-None-Match 优先于 If-Modified-Since
+    response.set_etag(meta.digest)
+    return response.make_conditional(request, accept_ranges=True, complete_length=response.content_length)
 
 
 @calendar_bp.route('/calendar/ics/_androidClient/<identifier>')
@@ -149,8 +159,11 @@ def android_client_get_ics(resource_type, identifier, semester):
             if not request.authorization:
                 return "Unauthorized (privacy on)", 401
             username, password = request.authorization
-            if not user_service.check_password(username, password):
-                return "Unauthorized (password wrong)", 401
+            try:
+                if not user_service.check_password(username, password):
+                    return "Unauthorized (password wrong)", 401
+            except ProcessPoolBusy:
+                return "Service busy, please retry later", 503
             if student.student_id != username:
                 return "Unauthorized (username mismatch)", 401
 
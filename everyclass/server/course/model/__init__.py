@@ -2,4 +2,4 @@ from .course import CourseMeta
 from .klass import KlassMeta
 from .klass_review import KlassReview
 from .questionnaire import Option, Question, Questionnaire, AnswerSheet, Answer
-from .suggest import Score
+from .suggest import Score, RatingColumns, get_rating_columns, invalidate_rating_columns, ratings_version, top_k
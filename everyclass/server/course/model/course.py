@@ -24,25 +24,33 @@ class CourseMeta(Base):
                   '思维与哲学', '学术', '法律', '自然与社会']
 
     @classmethod
-    def get_categories(cls):
-        """获得所有类别和对应的课程ID"""
+    def get_categories(cls, top_n: int = 3):
+        """获得所有类别和每个类别中评分最高的 top_n 个教学班"""
         from .klass import KlassMeta
 
-        results = db_session.query(KlassMeta).all()
+        # 用窗口函数在数据库中为每个类别的教学班按评分排名，只取出排名前 top_n 的教学班
+        ranked = db_session.query(KlassMeta.klass_id,
+                                  sa.func.row_number().over(partition_by=cls.main_category,
+                                                            order_by=(KlassMeta.score.desc(), KlassMeta.klass_id)).label('rank'),
+                                  sa.func.count().over().label('total')) \
+            .join(KlassMeta.course) \
+            .subquery()
+        rows = db_session.query(KlassMeta, ranked.c.total) \
+            .join(ranked, KlassMeta.klass_id == ranked.c.klass_id) \
+            .filter(ranked.c.rank <= top_n) \
+            .order_by(ranked.c.rank) \
+            .all()
 
         categories = {}
+        for klass, _ in rows:
+            categories.setdefault(klass.course.main_category, []).append(klass)
+        category_order = {category: i for i, category in enumerate(cls.CATEGORIES)}
 
-        for klass in results:
-            if klass.course.main_category not in categories:
-                categories[klass.course.main_category] = [klass]
-            else:
-                categories[klass.course.main_category].append(klass)
+        KlassMeta.prefetch_teachers([klass for klass, _ in rows])
 
-        for _, classes in categories.items():
-            classes.sort(key=lambda x: x.score, reverse=True)
-
-        return {'categories': [{'name': k, 'classes': v[:3]} for k, v in categories.items()],
-                'total_classes': len(results)}  # 每个类别只取前3门评分最高的课程
+        sorted_categories = sorted(categories.items(), key=lambda item: category_order.get(item[0], len(category_order)))
+        return {'categories': [{'name': k, 'classes': v} for k, v in sorted_categories],
+                'total_classes': rows[0][1] if rows else 0}
 
     @classmethod
     def import_demo_content(cls):
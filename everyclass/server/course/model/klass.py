@@ -1,5 +1,6 @@
 import json
 import os
+from typing import List
 
 import sqlalchemy as sa
 from sqlalchemy import Column, String, Integer, Float
@@ -30,19 +31,30 @@ class KlassMeta(Base, JSONSerializable):
     reviews = relationship("KlassReview", back_populates="klass", lazy=True)
 
     def __json_encode__(self):
-        from everyclass.server.entity.service import get_people_info
+        from everyclass.server.entity.service import get_people_info_batch
 
         return {'class_id': self.klass_id,
                 'name': self.course.name,
-                'teachers': [{'name': t.name, 'title': t.title} for t in [get_people_info(teacher_id)[1] for teacher_id in self.teachers]],
-                # todo 速度太慢了，entity要出批量查询接口
+                'teachers': [{'name': t[1].name, 'title': t[1].title} for t in get_people_info_batch(self.teachers) if t],
                 'score': round(self.score, 1),
                 'review_quote': self.review_quote}
 
+    @classmethod
+    def prefetch_teachers(cls, classes: List["KlassMeta"]) -> None:
+        """一次性批量查询多个教学班的任课教师信息，之后序列化时直接命中缓存"""
+        from everyclass.server.entity.service import get_people_info_batch
+
+        get_people_info_batch([teacher_id for klass in classes for teacher_id in (klass.teachers or [])])
+
     @classmethod
     def get_all(cls):
         return db_session.query(cls).all()
 
+    @classmethod
+    def get_by_ids(cls, klass_ids: List[int]) -> List["KlassMeta"]:
+        """批量查询教学班，返回结果的顺序不保证与 klass_ids 相同"""
+        return db_session.query(cls).filter(cls.klass_id.in_(klass_ids)).all()
+
     @classmethod
     def import_demo_content(cls):
         with open(os.path.join(os.path.dirname(__file__), "klass.json")) as f:
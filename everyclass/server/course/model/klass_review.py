@@ -1,12 +1,32 @@
+import datetime
 import os
 import random
 import re
+import time
+from typing import Any, Dict
 
-from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, Float, DateTime, ForeignKey, Numeric, cast
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import exists, func, or_, select
 
 from everyclass.server.utils.db.postgres import Base, db_session
+from everyclass.server.utils.db.redis import redis, redis_prefix
+
+_LAST_SYNC_KEY = f"{redis_prefix}:klass_review_last_sync"
+_SYNC_OVERLAP = datetime.timedelta(minutes=5)  # 增量同步时多回看一段时间，覆盖上次同步开始时还未提交的评价
+
+
+_RATING_COLUMNS = ('score', 'rating_knowledge', 'rating_attendance', 'final_score', 'gender_rate')
+
+
+def _any_distinct(table, values: Dict[str, Any]):
+    """任意一列的当前值与新值不同（NULL 与非 NULL 视为不同）"""
+    return or_(*(table.c[column].is_distinct_from(value) for column, value in values.items()))
+
+
+def _round2(expr):
+    """保留两位小数。PostgreSQL 的 round(x, n) 不接受 double precision，需要先转为 numeric"""
+    return func.round(cast(expr, Numeric), 2)
 
 
 class KlassReview(Base):
@@ -63,46 +83,73 @@ class KlassReview(Base):
         db_session.commit()
 
     @classmethod
-    def sync_to_class_meta(cls):
-        """同步class评价到class元信息表"""
-        from everyclass.server.course.model import KlassMeta
+    def sync_to_class_meta(cls, incremental: bool = False) -> Dict[str, Any]:
+        """
+        同步class评价到class元信息表，完成后使推荐使用的评分列缓存失效
+
+        在数据库中用一条聚合 UPDATE 完成，整个同步在一个事务中提交。
+
+        :param incremental: 只重新计算上次同步以来有新评价的教学班。没有上次同步的记录时退化为全量同步
+        :return: 同步模式、评分发生变化的教学班数、新重置为无评价的教学班数和耗时（毫秒）
+        """
+        from everyclass.server import logger
+        from everyclass.server.course.model import KlassMeta, invalidate_rating_columns
+
+        start = time.perf_counter()
+        klass_meta = KlassMeta.__table__
+        reviews = cls.__table__
+
+        since = None
+        if incremental:
+            last_sync = redis.get(_LAST_SYNC_KEY)
+            if last_sync:
+                since = datetime.datetime.fromisoformat(last_sync.decode()) - _SYNC_OVERLAP
+        sync_started_at = db_session.query(func.now()).scalar()
+
+        rating_knowledge = func.avg(reviews.c.rating_knowledge)
+        rating_attendance = func.avg(reviews.c.rating_attendance)
+        final_score = func.avg(reviews.c.final_score)
+        gender_rate = func.avg(reviews.c.gender_rate)
+        averages = select([reviews.c.klass_id,
+                           _round2((rating_knowledge * 4 + rating_attendance * 3 + final_score / 20 * 3) / 10).label('score'),
+                           _round2(rating_knowledge).label('rating_knowledge'),
+                           _round2(rating_attendance).label('rating_attendance'),
+                           _round2(final_score).label('final_score'),
+                           _round2(gender_rate).label('gender_rate')]).group_by(reviews.c.klass_id)
+        if since is not None:
+            changed = select([reviews.c.klass_id]).where(reviews.c.create_time > since)
+            averages = averages.where(reviews.c.klass_id.in_(changed))
+        averages = averages.alias('averages')
+
+        # UPDATE klass_meta SET ... FROM (SELECT klass_id, avg(...) FROM klass_review GROUP BY klass_id) WHERE ...
+        # 只更新值发生变化的行（IS DISTINCT FROM），更新行数即实际变化的教学班数，没有变化时不会使缓存失效
+        new_values = {column: averages.c[column] for column in _RATING_COLUMNS}
+        updated = db_session.execute(klass_meta.update()
+                                     .where(klass_meta.c.klass_id == averages.c.klass_id)
+                                     .where(_any_distinct(klass_meta, new_values))
+                                     .values(**new_values)).rowcount
+
+        # 评价只会新增，增量同步时不会有教学班变为没有评价
+        reset = 0
+        if since is None:
+            has_review = exists().where(reviews.c.klass_id == klass_meta.c.klass_id)
+            no_review_values = {column: -1 for column in _RATING_COLUMNS}
+            reset = db_session.execute(klass_meta.update()
+                                       .where(~has_review)
+                                       .where(_any_distinct(klass_meta, no_review_values))
+                                       .values(**no_review_values)).rowcount
+        db_session.commit()
+
+        redis.set(_LAST_SYNC_KEY, sync_started_at.isoformat())
+        if updated or reset:
+            invalidate_rating_columns()
 
-        all_classes = db_session.query(KlassMeta).all()
-        for klass in all_classes:
-            if len(klass.reviews) == 0:
-                klass.score = -1
-                klass.rating_knowledge = -1
-                klass.rating_attendance = -1
-                klass.final_score = -1
-                klass.gender_rate = -1
-
-                db_session.commit()
-                continue
-
-            rating_knowledge = 0
-            rating_attendance = 0
-            final_score = 0
-            gender_rate = 0
-            for review in klass.reviews:
-                rating_knowledge += review.rating_knowledge
-                rating_attendance += review.rating_attendance
-                final_score += review.final_score
-                gender_rate += review.gender_rate
-
-            rating_knowledge /= len(klass.reviews)
-            rating_attendance /= len(klass.reviews)
-            final_score /= len(klass.reviews)
-            gender_rate /= len(klass.reviews)
-            overall_score = (rating_knowledge * 4 + rating_attendance * 3 + final_score / 20 * 3) / 10
-
-            klass.score = round(overall_score, 2)
-            klass.rating_knowledge = round(rating_knowledge, 2)
-            klass.rating_attendance = round(rating_attendance, 2)
-            klass.final_score = round(final_score, 2)
-            klass.gender_rate = round(gender_rate, 2)
-
-            db_session.commit()
-        return
+        result = {"mode": "full" if since is None else "incremental",
+                  "updated": updated,
+                  "reset": reset,
+                  "elapsed_ms": round((time.perf_counter() - start) * 1000)}
+        logger.info("klass reviews synced to klass_meta", extra=result)
+        return result
 
     @classmethod
     def import_demo_content(cls):
@@ -1,5 +1,7 @@
 from typing import List, Optional
 
+import numpy as np
+
 from everyclass.server.utils import JSONSerializable
 
 
@@ -113,12 +115,11 @@ class AnswerSheet:
 
     def get_advice(self):
         """根据选修课推荐问卷获得推荐结果"""
-        from everyclass.server.course.model import Score, KlassMeta, CourseMeta
+        from everyclass.server.course.model import Score, KlassMeta, CourseMeta, get_rating_columns, top_k
         from everyclass.server.utils.base_exceptions import InvalidRequestException
 
-        # 获得教学班与score二元组的列表
-        classes = [(klass, Score()) for klass in KlassMeta.get_all()]
-        print("classes get")
+        columns = get_rating_columns()
+        n = len(columns)
 
         q0a = self.get_answer(0)
         q1a = self.get_answer(1)
@@ -126,101 +127,104 @@ class AnswerSheet:
         q3a = self.get_answer(3)
         q4a = self.get_answer(4)
         q5a = self.get_answer(5)
-        for klass, score in classes:
-            # KnowledgeProcessor: 使用课程评价中"是否学到了新的知识"进行打分
-            processor_name = 'KnowledgeProcessor'
-            reason = f"课堂收获{klass.rating_knowledge}/5"
-            if q0a == [0]:
-                score.add_score(klass.rating_knowledge * 20, processor_name, reason)
-            elif q0a == [1]:
-                score.add_score(klass.rating_knowledge * 10, processor_name, reason)
-            elif q0a == [2]:
-                score.add_score(klass.rating_knowledge * 5, processor_name, reason)
-            else:
-                raise InvalidRequestException(f"answer of question 0 ({q0a}) is not expected")
-
-            # ScoreProcessor
-            processor_name = 'ScoreProcessor'
-            if q0a == [2]:
-                # 为了成绩的严格筛选成绩
-                if q1a == [0]:
-                    wanted_score = 95
-                elif q1a == [1]:
-                    wanted_score = 90
-                elif q1a == [2]:
-                    wanted_score = 80
-                else:
-                    wanted_score = 60
-                if klass.final_score < wanted_score:
-                    score.add_score(-1000, processor_name)
-            else:
-                # 不需严格按照成绩筛选课程，但期望和现实的差异影响满意度
-                if klass.final_score >= 95:
-                    score_level = 1
-                elif klass.final_score >= 90:
-                    score_level = 2
-                elif klass.final_score >= 80:
-                    score_level = 3
-                else:
-                    score_level = 4
-
-                if q1a == [0]:
-                    wanted_level = 1
-                elif q1a == [1]:
-                    wanted_level = 2
-                elif q1a == [2]:
-                    wanted_level = 3
-                else:
-                    wanted_level = 4
-
-                if score_level <= wanted_level:
-                    satisfaction = 100
-                else:
-                    satisfaction = 100 - (score_level - wanted_level) * 20
-
-                score.add_score(satisfaction, processor_name, f"平均期末成绩：{klass.final_score}")
-
-            # ThemeProcessor：
-            processor_name = 'ThemeProcessor'
-            if q0a == [0]:
-                satisfaction_hit = 100
-                satisfaction_miss = 20
-            elif q0a == [1]:
-                satisfaction_hit = 100
-                satisfaction_miss = 50
+
+        # 每个 processor 表示为 (名称, 各教学班的加分, 生效的教学班掩码, 推荐理由)。掩码为 None 表示对所有教学班生效，
+        # 推荐理由是以 KlassMeta 为参数的函数，只对最终返回的教学班调用
+        processors = []
+
+        # KnowledgeProcessor: 使用课程评价中"是否学到了新的知识"进行打分
+        if q0a == [0]:
+            knowledge_weight = 20
+        elif q0a == [1]:
+            knowledge_weight = 10
+        elif q0a == [2]:
+            knowledge_weight = 5
+        else:
+            raise InvalidRequestException(f"answer of question 0 ({q0a}) is not expected")
+        processors.append(('KnowledgeProcessor', columns.rating_knowledge * knowledge_weight, None,
+                           lambda klass: f"课堂收获{klass.rating_knowledge}/5"))
+
+        # ScoreProcessor
+        if q0a == [2]:
+            # 为了成绩的严格筛选成绩
+            if q1a == [0]:
+                wanted_score = 95
+            elif q1a == [1]:
+                wanted_score = 90
+            elif q1a == [2]:
+                wanted_score = 80
             else:
-                satisfaction_hit = 100
-                satisfaction_miss = 80
-            interested_categories = [CourseMeta.CATEGORIES[i] for i in q2a]
-            if klass.course.main_category in interested_categories:
-                score.add_score(satisfaction_hit, processor_name)
+                wanted_score = 60
+            processors.append(('ScoreProcessor', np.full(n, -1000), columns.final_score < wanted_score, None))
+        else:
+            # 不需严格按照成绩筛选课程，但期望和现实的差异影响满意度
+            # 成绩档次：>=95 为 1，>=90 为 2，>=80 为 3，其余为 4
+            final_score = columns.final_score
+            score_level = 4 - (final_score >= 80).astype(np.int64) - (final_score >= 90) - (final_score >= 95)
+
+            if q1a == [0]:
+                wanted_level = 1
+            elif q1a == [1]:
+                wanted_level = 2
+            elif q1a == [2]:
+                wanted_level = 3
             else:
-                score.add_score(satisfaction_miss, processor_name)
-
-            processor_name = 'FriendProcessor'
-            # FriendProcessor：如果q0选了2，且q3选了1，则过滤男女比例过于不协调的课程
-            if q0a == [2] and q3a == [1]:
-                if (q4a == [0] and klass.gender_rate <= 2) or (q4a == [1] and klass.gender_rate >= 8):
-                    # 想认识男生、课程80%以上为女生，或想认识女生，课程80%以上为男生
-                    score.add_score(-1000, processor_name, f"男女比{klass.gender_rate}:{10 - klass.gender_rate}")
-                else:
-                    score.add_score(0, processor_name, f"男女比{klass.gender_rate}:{10 - klass.gender_rate}")
-
-            processor_name = 'AttendanceProcessor'
-            # AttendanceProcessor：
-            # 如果选择了'无所谓，反正我每节课都会来'，加权为0（考勤rate不对class的评分有影响）；
-            # 如果选择了'希望偶尔能请假'，给4、5惩罚加权-20；
-            # 如果选择了'希望老师要求松一点，偶尔不来也不会被发现'，4、5过滤，3惩罚加权-20
-            if q5a == [1] and klass.rating_attendance >= 4:
-                score.add_score(-20 * klass.rating_attendance, processor_name)
-            if q5a == [2]:
-                if klass.rating_attendance >= 4:
-                    score.add_score(-1000, processor_name)
-                elif klass.rating_attendance >= 3:
-                    score.add_score(-20 * klass.rating_attendance, processor_name)
-
-        print("scored")
-
-        classes.sort(key=lambda t: t[1].score, reverse=True)
-        print("sorted")
-        return {'classes': classes[:10]}
+                wanted_level = 4
+
+            satisfaction = 100 - np.maximum(score_level - wanted_level, 0) * 20
+            processors.append(('ScoreProcessor', satisfaction, None, lambda klass: f"平均期末成绩：{klass.final_score}"))
+
+        # ThemeProcessor：
+        if q0a == [0]:
+            satisfaction_hit = 100
+            satisfaction_miss = 20
+        elif q0a == [1]:
+            satisfaction_hit = 100
+            satisfaction_miss = 50
+        else:
+            satisfaction_hit = 100
+            satisfaction_miss = 80
+        interested_categories = [i for i in (q2a or []) if 0 <= i < len(CourseMeta.CATEGORIES)]
+        processors.append(('ThemeProcessor',
+                           np.where(np.isin(columns.category, interested_categories), satisfaction_hit, satisfaction_miss),
+                           None, None))
+
+        # FriendProcessor：如果q0选了2，且q3选了1，则过滤男女比例过于不协调的课程
+        if q0a == [2] and q3a == [1]:
+            # 想认识男生、课程80%以上为女生，或想认识女生，课程80%以上为男生
+            unbalanced = ((q4a == [0]) & (columns.gender_rate <= 2)) | ((q4a == [1]) & (columns.gender_rate >= 8))
+            processors.append(('FriendProcessor', np.where(unbalanced, -1000, 0), None,
+                               lambda klass: f"男女比{klass.gender_rate}:{10 - klass.gender_rate}"))
+
+        # AttendanceProcessor：
+        # 如果选择了'无所谓，反正我每节课都会来'，加权为0（考勤rate不对class的评分有影响）；
+        # 如果选择了'希望偶尔能请假'，给4、5惩罚加权-20；
+        # 如果选择了'希望老师要求松一点，偶尔不来也不会被发现'，4、5过滤，3惩罚加权-20
+        if q5a == [1]:
+            processors.append(('AttendanceProcessor', -20 * columns.rating_attendance, columns.rating_attendance >= 4, None))
+        if q5a == [2]:
+            processors.append(('AttendanceProcessor',
+                               np.where(columns.rating_attendance >= 4, -1000, -20 * columns.rating_attendance),
+                               columns.rating_attendance >= 3, None))
+
+        total = np.zeros(n)
+        for _, values, mask, _ in processors:
+            total += values if mask is None else np.where(mask, values, 0)
+        total[np.isnan(total)] = -np.inf  # 缺少评分的教学班排在最后
+
+        top = top_k(total, 10)
+        klasses = {klass.klass_id: klass for klass in KlassMeta.get_by_ids(columns.klass_id[top].tolist())}
+
+        classes = []
+        for i in top.tolist():
+            klass = klasses.get(int(columns.klass_id[i]))
+            if klass is None:
+                continue  # 评分列加载后被删除的教学班
+            score = Score()
+            for processor_name, values, mask, reason in processors:
+                if mask is None or mask[i]:
+                    score.add_score(values[i].item(), processor_name, reason(klass) if reason else None)
+            classes.append((klass, score))
+
+        KlassMeta.prefetch_teachers([klass for klass, _ in classes])
+        return {'classes': classes}
@@ -1,4 +1,23 @@
+"""
+选修课推荐
+
+推荐时需要对所有教学班打分。教学班的评分列（每日由 KlassReview.sync_to_class_meta 从评价中汇总）以列存的 NumPy 数组缓存在进程内，
+打分用向量化的数组运算完成，只为最终返回的教学班加载 ORM 对象、生成推荐理由。
+
+评分同步完成后 Redis 中的版本号加一，各 worker 在下一次推荐时发现版本变化，重新加载评分列。
+"""
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from redis.exceptions import RedisError
+
 from everyclass.server.utils import JSONSerializable
+from everyclass.server.utils.db.postgres import db_session
+from everyclass.server.utils.db.redis import redis, redis_prefix
+
+_VERSION_KEY = f"{redis_prefix}:klass_ratings_version"
 
 
 class Score(JSONSerializable):
@@ -17,3 +36,92 @@ class Score(JSONSerializable):
         self.details[processor_name] = score
         if reason:
             self.reasons.append(reason)
+
+
+@dataclass(frozen=True)
+class RatingColumns:
+    """klass_meta 中评分相关列的列存副本，各数组的下标一一对应。数据库中为 NULL 的评分为 nan"""
+    klass_id: np.ndarray
+    rating_knowledge: np.ndarray
+    rating_attendance: np.ndarray
+    final_score: np.ndarray
+    gender_rate: np.ndarray
+    category: np.ndarray  # 课程主分类在 CourseMeta.CATEGORIES 中的下标，不在其中为 -1
+
+    def __len__(self):
+        return len(self.klass_id)
+
+    @classmethod
+    def load(cls) -> "RatingColumns":
+        """只查询需要的列，不构造 ORM 对象"""
+        from everyclass.server.course.model import CourseMeta, KlassMeta
+
+        rows = db_session.query(KlassMeta.klass_id, KlassMeta.rating_knowledge, KlassMeta.rating_attendance,
+                                KlassMeta.final_score, KlassMeta.gender_rate, CourseMeta.main_category) \
+            .outerjoin(KlassMeta.course) \
+            .order_by(KlassMeta.klass_id) \
+            .all()
+        category_index = {category: i for i, category in enumerate(CourseMeta.CATEGORIES)}
+
+        return cls(klass_id=np.array([row[0] for row in rows], dtype=np.int64),
+                   rating_knowledge=np.array([row[1] for row in rows], dtype=np.float64),
+                   rating_attendance=np.array([row[2] for row in rows], dtype=np.float64),
+                   final_score=np.array([row[3] for row in rows], dtype=np.float64),
+                   gender_rate=np.array([row[4] for row in rows], dtype=np.float64),
+                   category=np.array([category_index.get(row[5], -1) for row in rows], dtype=np.int16))
+
+
+_columns: Optional[RatingColumns] = None
+_columns_version: Optional[bytes] = None
+_columns_lock = threading.Lock()
+
+
+def ratings_version() -> Optional[bytes]:
+    """评分数据的版本号，每次评分同步后变化。从未同步过时为 None"""
+    return redis.get(_VERSION_KEY)
+
+
+def get_rating_columns() -> RatingColumns:
+    """获得当前进程缓存的评分列，Redis 中的版本号变化后重新加载"""
+    global _columns, _columns_version
+
+    try:
+        version = ratings_version()
+    except RedisError:
+        version = _columns_version  # Redis 不可用时继续使用已加载的数据
+
+    with _columns_lock:
+        if _columns is None or version != _columns_version:
+            _columns = RatingColumns.load()
+            _columns_version = version
+        return _columns
+
+
+def invalidate_rating_columns() -> None:
+    """评分同步完成后调用，使所有 worker 在下一次推荐时重新加载评分列，同时使课程分类的缓存失效"""
+    global _columns
+
+    redis.incr(_VERSION_KEY)
+    with _columns_lock:
+        _columns = None
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    返回 scores 中最大的 k 个元素的下标，按分数从高到低排列，分数相同时下标小的在前（与对全部元素稳定排序的前 k 个相同）。
+    只对选出的 k 个元素排序
+
+    >>> top_k(np.array([3, 1, 4, 1, 5]), 2).tolist()
+    [4, 2]
+    >>> top_k(np.array([1, 2, 2, 2, 0]), 2).tolist()
+    [1, 2]
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    # argpartition 在第 k 大的分数有并列时选出哪些下标是不确定的，因此只用它找出第 k 大的分数，并列的取下标最小的几个
+    threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > threshold)
+    tied = np.flatnonzero(scores == threshold)[:k - len(above)]
+    selected = np.concatenate([above, tied])
+    return selected[np.lexsort((selected, -scores[selected]))]
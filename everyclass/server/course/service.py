@@ -1,4 +1,8 @@
-from everyclass.server.course.model import Questionnaire, AnswerSheet, CourseMeta
+from redis.exceptions import RedisError
+
+from everyclass.server.course.model import Questionnaire, AnswerSheet, CourseMeta, ratings_version
+from everyclass.server.utils.cache import cached
+from everyclass.server.utils.jsonable import PrecomputedJSON, precompute_json
 
 
 def get_class_categories():
@@ -6,6 +10,21 @@ def get_class_categories():
     return CourseMeta.get_categories()
 
 
+def get_class_categories_json() -> PrecomputedJSON:
+    """课程分类的 API 响应体，缓存到下一次评分同步（或数据版本变化，任课教师信息可能随之变化）为止"""
+    try:
+        version = ratings_version()
+    except RedisError:
+        version = None
+    return _class_categories_json(version.decode() if version else "0")
+
+
+@cached("course_categories_json")
+def _class_categories_json(version: str) -> PrecomputedJSON:
+    """version 为评分数据的版本号，只用作缓存键。任课教师在 get_categories 中一次批量查询，序列化时直接命中缓存"""
+    return precompute_json({'status': 'success', 'data': get_class_categories()})
+
+
 def get_advice_questions():
     """获得选修课推荐问卷"""
     questionnaire = Questionnaire.get()
@@ -3,13 +3,14 @@ from flask import Blueprint, request
 from everyclass.server.course import service as course_service
 from everyclass.server.course.model import Answer, AnswerSheet
 from everyclass.server.utils import generate_success_response
+from everyclass.server.utils.jsonable import to_precomputed_json_response
 
 course_api_bp = Blueprint('api_course', __name__)
 
 
 @course_api_bp.route('/_categories')
 def class_categories():
-    return generate_success_response(course_service.get_class_categories())
+    return to_precomputed_json_response(course_service.get_class_categories_json())
 
 
 @course_api_bp.route('/_questionnaire')
@@ -1,11 +1,64 @@
+import bisect
 import datetime
-from typing import Tuple, List
+import functools
+from typing import Dict, List, Optional, Tuple
 
 from everyclass.rpc import RpcClientException, RpcServerException, RpcTimeout
 from everyclass.server.utils import base_exceptions
 from everyclass.server.utils.config import get_config
 
 
+class SemesterCalendar:
+    """
+    预先编译的学期日历，由配置中的 AVAILABLE_SEMESTERS 构建一次，之后的查询不再排序或遍历配置：
+
+    - 日期 -> (学期, 周次, 星期)：对按开始日期排序的学期列表二分查找，O(log n)
+    - (学期, 周次, 星期) -> 上课日期：开始日期加偏移后查调课表，O(1)
+    """
+
+    def __init__(self, available_semesters: Dict[Tuple[int, int, int], Dict]):
+        semesters = sorted(available_semesters.items(), key=lambda x: x[1]["start"])
+
+        self._starts: List[datetime.date] = [datetime.date(*sem[1]["start"]) for sem in semesters]
+        self._names: List[str] = ["-".join([str(x) for x in sem[0]]) for sem in semesters]
+        self._start_of: Dict[Tuple[int, int, int], datetime.date] = {sem[0]: start for sem, start in zip(semesters, self._starts)}
+
+        # 学期 -> {原上课日期: 调整后的日期，None 表示这天的课直接放掉}
+        self._adjustments: Dict[Tuple[int, int, int], Dict[datetime.date, Optional[datetime.date]]] = {}
+        for sem, detail in semesters:
+            self._adjustments[sem] = {datetime.date(*from_): datetime.date(*adj['to']) if adj['to'] else None
+                                      for from_, adj in detail.get('adjustments', {}).items()}
+
+    def semester_date(self, date: datetime.date) -> Tuple[str, int, int]:
+        """获取日期对应的学期、所属周次及星期（0表示周日，1表示周一...）"""
+        index = bisect.bisect_right(self._starts, date) - 1
+        if index < 0:
+            raise ValueError("no applicable semester")
+        days_delta = (date - self._starts[index]).days
+        return self._names[index], days_delta // 7 + 1, days_delta % 7
+
+    def lesson_date(self, semester: Tuple[int, int, int], week: int, day: int) -> Optional[datetime.date]:
+        """
+        获得某学期某周某天（1表示周一...7表示周日）实际的上课日期，已应用调课规则。这天的课被放掉时返回 None
+        """
+        date = self._start_of[semester] + datetime.timedelta(days=(week - 1) * 7 + day)
+        adjustments = self._adjustments[semester]
+        if date in adjustments:
+            return adjustments[date]
+        return date
+
+
+_semester_calendar: Optional[SemesterCalendar] = None
+
+
+def get_semester_calendar() -> SemesterCalendar:
+    """获得学期日历单例。配置只加载一次，所以日历也只需构建一次"""
+    global _semester_calendar
+    if _semester_calendar is None:
+        _semester_calendar = SemesterCalendar(get_config().AVAILABLE_SEMESTERS)
+    return _semester_calendar
+
+
 def get_semester_date(date: datetime.date) -> Tuple[str, int, int]:
     """获取日期对应的学期、所属周次及星期（0表示周日，1表示周一...）
 
@@ -15,17 +68,7 @@ def get_semester_date(date: datetime.date) -> Tuple[str, int, int]:
     >>> get_semester_date(datetime.date(2020, 2, 23))
     ('2019-2020-2', 1, 0)
     """
-    config = get_config()
-
-    semesters = list(config.AVAILABLE_SEMESTERS.items())
-    semesters.sort(key=lambda x: x[0], reverse=True)
-
-    for sem in semesters:
-        sem_start_date = datetime.date(*sem[1]["start"])
-        if date >= sem_start_date:
-            days_delta = (date - sem_start_date).days
-            return "-".join([str(x) for x in sem[0]]), days_delta // 7 + 1, days_delta % 7
-    raise ValueError("no applicable semester")
+    return get_semester_calendar().semester_date(date)
 
 
 def semester_calculate(current_semester: str, semester_list: List[str]) -> List[Tuple[str, bool]]:
@@ -43,6 +86,7 @@ def semester_calculate(current_semester: str, semester_list: List[str]) -> List[
 def replace_exception(func):
     """将RPC模块的错误类型替换成业务类型的错误"""
 
+    @functools.wraps(func)
     def _func(*args, **kwargs):
         try:
             return func(*args, **kwargs)
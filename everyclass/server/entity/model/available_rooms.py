@@ -11,7 +11,7 @@ from everyclass.server.entity.domain import get_semester_date
 from everyclass.server.utils import JSONSerializable
 from everyclass.server.utils.db.postgres import Base, db_session
 from everyclass.server.utils.db.redis import redis, redis_prefix
-from everyclass.server.utils.encryption import encrypt, RTYPE_ROOM
+from everyclass.server.utils.encryption import encrypt, encrypt_many, RTYPE_ROOM
 
 
 @dataclass
@@ -25,10 +25,10 @@ class Room(JSONSerializable):
         return {'name': self.name, 'room_id_encoded': self.room_id_encoded, 'occupied_feedback_cnt': self.occupied_feedback_cnt}
 
     @classmethod
-    def make(cls, name: str, room_id: str, feedback_cnt: int):
+    def make(cls, name: str, room_id: str, feedback_cnt: int, room_id_encoded: str = None):
         dct = {'name': name,
                'room_id': room_id,
-               'room_id_encoded': encrypt(RTYPE_ROOM, room_id),
+               'room_id_encoded': room_id_encoded or encrypt(RTYPE_ROOM, room_id),
                'occupied_feedback_cnt': feedback_cnt}
         return cls(**ensure_slots(cls, dct))
 
@@ -46,12 +46,16 @@ class AvailableRooms(JSONSerializable):
         resp = Entity.get_available_rooms(week, f"{day + 1}{time}", campus, building)
         logger.info(f"get available rooms for week={week}, session={day + 1}{time}, campus={campus}, building={building}")
 
-        self.rooms: List[Room] = []
-        for r in resp:
-            # 反馈占用计数
-            feedback_cnt = redis.get(f"{redis_prefix}:avail_room_occupy_fb:{week}:{day}:{time}:{r['code']}")
+        # 反馈占用计数，同一时段所有教室的计数在一个 hash 中，一次 HGETALL 取出
+        feedback_cnts = redis.hgetall(_occupy_feedback_key(week, day, time))
+
+        encoded = encrypt_many(RTYPE_ROOM, [r['code'] for r in resp])
 
-            self.rooms.append(Room.make(name=r['name'], room_id=r['code'], feedback_cnt=int(feedback_cnt.decode()) if feedback_cnt else 0))
+        self.rooms: List[Room] = []
+        for r, room_id_encoded in zip(resp, encoded):
+            feedback_cnt = feedback_cnts.get(r['code'].encode())
+            self.rooms.append(Room.make(name=r['name'], room_id=r['code'], feedback_cnt=int(feedback_cnt) if feedback_cnt else 0,
+                                        room_id_encoded=room_id_encoded))
 
 
 class UnavailableRoomReport(Base):
@@ -76,5 +80,17 @@ class UnavailableRoomReport(Base):
         db_session.commit()
 
         _, week, day = get_semester_date(date)
-        redis.incr(f"{redis_prefix}:avail_room_occupy_fb:{week}:{day}:{time}:{room_id}", 1)
+        key = _occupy_feedback_key(week, day, time)
+        with redis.pipeline() as pipe:
+            pipe.hincrby(key, room_id, 1)
+            pipe.expire(key, OCCUPY_FEEDBACK_TTL)
+            pipe.execute()
         return report
+
+
+OCCUPY_FEEDBACK_TTL = 60 * 60 * 24 * 7 * 30  # 反馈计数保留约一个学期
+
+
+def _occupy_feedback_key(week: int, day: int, time: str) -> str:
+    """某周某天某节次的教室占用反馈计数，hash 的 field 为教室 ID，value 为反馈人数"""
+    return f"{redis_prefix}:avail_room_occupy_fb:{week}:{day}:{time}"
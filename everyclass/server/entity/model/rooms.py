@@ -3,7 +3,7 @@ from typing import List, Dict
 
 from everyclass.rpc import ensure_slots
 from everyclass.server.utils import JSONSerializable
-from everyclass.server.utils.encryption import encrypt, RTYPE_ROOM
+from everyclass.server.utils.encryption import encrypt, encrypt_many, RTYPE_ROOM
 
 
 @dataclass
@@ -30,7 +30,9 @@ class Building(JSONSerializable):
 
     @classmethod
     def make(cls, name: str, rooms: Dict[str, str]) -> "Building":
-        dct_new = {"name": name, "rooms": [Room.make(room_id, name) for room_id, name in rooms.items()]}
+        encoded = encrypt_many(RTYPE_ROOM, list(rooms.keys()))
+        dct_new = {"name": name, "rooms": [Room(name=room_name, room_id=room_id, room_id_encoded=room_id_encoded)
+                                           for (room_id, room_name), room_id_encoded in zip(rooms.items(), encoded)]}
         return cls(**ensure_slots(cls, dct_new))
 
 
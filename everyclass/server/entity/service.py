@@ -1,5 +1,5 @@
 import datetime
-from typing import Tuple, Union, List
+from typing import Tuple, Union, List, Optional
 
 from sqlalchemy.exc import IntegrityError
 
@@ -7,38 +7,49 @@ from everyclass.rpc.entity import SearchResultStudentItem, SearchResultTeacherIt
 from everyclass.server.entity.domain import replace_exception
 from everyclass.server.entity.exceptions import AlreadyReported
 from everyclass.server.entity.model import MultiPeopleSchedule, AllRooms, AvailableRooms, UnavailableRoomReport
+from everyclass.server.utils.cache import cached, single_flight
+from everyclass.server.utils.concurrency import fan_out
+from everyclass.server.utils.config import get_config
+from everyclass.server.utils.jsonable import PrecomputedJSON, precompute_json
 
 
+@single_flight("search")
 @replace_exception
 def search(keyword: str) -> SearchResult:
     return Entity.search(keyword)
 
 
+@single_flight("student")
 @replace_exception
 def get_student(student_id: str):
     return Entity.get_student(student_id)
 
 
+@cached("student_timetable")
 @replace_exception
 def get_student_timetable(student_id: str, semester: str):
     return Entity.get_student_timetable(student_id, semester)
 
 
+@cached("teacher_timetable")
 @replace_exception
 def get_teacher_timetable(teacher_id: str, semester: str):
     return Entity.get_teacher_timetable(teacher_id, semester)
 
 
+@cached("classroom_timetable")
 @replace_exception
 def get_classroom_timetable(semester: str, room_id: str):
     return Entity.get_classroom_timetable(semester, room_id)
 
 
+@single_flight("card")
 @replace_exception
 def get_card(semester: str, card_id: str) -> CardResult:
     return Entity.get_card(semester, card_id)
 
 
+@single_flight("teacher")
 @replace_exception
 def get_teacher(teacher_id: str):
     return Entity.get_teacher(teacher_id)
@@ -49,6 +60,12 @@ def get_rooms():
     return AllRooms.make(Entity.get_rooms())
 
 
+@cached("rooms_json")
+def get_rooms_json() -> PrecomputedJSON:
+    """教室列表的 API 响应体。数据版本内不变，每个版本只序列化、压缩一次"""
+    return precompute_json({'status': 'success', 'data': get_rooms()})
+
+
 @replace_exception
 def get_available_rooms(campus: str, building: str, date: datetime.date, time: str):
     # time 格式为0102这种，表示第1-2节
@@ -76,12 +93,38 @@ def get_people_info(identifier: str) -> Tuple[bool, Union[SearchResultStudentIte
      the identifier is not found, a PeopleNotFoundError is raised. The second parameter is the info of student or
      teacher.
     """
+    info = _find_people(identifier)
+    if info is None:
+        raise PeopleNotFoundError
+    return info
+
+
+@cached("people_info", negative_ttl=get_config().PEOPLE_NOT_FOUND_TTL)
+def _find_people(identifier: str) -> Optional[Tuple[bool, Union[SearchResultStudentItem, SearchResultTeacherItem]]]:
+    """找不到时返回 None。不存在的结果也会被缓存 PEOPLE_NOT_FOUND_TTL 秒，避免每次渲染包含未知 ID 的页面都调用一次搜索"""
     result = search(identifier)
     if len(result.students) > 0:
         return True, result.students[0]
     if len(result.teachers) > 0:
         return False, result.teachers[0]
-    raise PeopleNotFoundError
+    return None
+
+
+def get_people_info_batch(identifiers: List[str]) -> List[Optional[Tuple[bool, Union[SearchResultStudentItem, SearchResultTeacherItem]]]]:
+    """
+    批量获得多人的基本信息，返回的列表与输入一一对应，找不到的人对应 None
+
+    api-server 没有批量查询接口，所以先去重，从两级缓存中批量取出已缓存的（Redis 层只需一次 MGET），其余的并发调用搜索。
+    """
+    unique_ids = list(dict.fromkeys(identifiers))
+
+    keys = {identifier: _find_people.key_for(identifier) for identifier in unique_ids}
+    found = _find_people.cache.get_many(keys.values())
+    infos = {identifier: found[key] for identifier, key in keys.items() if key in found}
+    misses = [identifier for identifier in unique_ids if identifier not in infos]
+
+    infos.update(zip(misses, fan_out(_find_people, [(i,) for i in misses], span_name="entity.get_people_info")))
+    return [infos[identifier] for identifier in identifiers]
 
 
 def multi_people_schedule(people: List[str], date: datetime.date, current_user: str) -> MultiPeopleSchedule:
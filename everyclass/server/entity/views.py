@@ -1,14 +1,17 @@
+import time
 from collections import defaultdict
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Tuple
 
 from ddtrace import tracer
 from flask import Blueprint, current_app as app, escape, flash, redirect, render_template, request, session, url_for
+from markupsafe import Markup
 
 from everyclass.common.format import contains_chinese
 from everyclass.common.time import get_day_chinese, get_time_chinese, lesson_string_to_tuple
 from everyclass.server import logger
 from everyclass.server.entity import service as entity_service
 from everyclass.server.entity.domain import semester_calculate
+from everyclass.server.utils.cache import cached
 from everyclass.server.utils.encryption import decrypt
 from everyclass.server.utils.session import StudentSession
 from everyclass.server.utils.web_consts import MSG_INVALID_IDENTIFIER, SESSION_LAST_VIEWED_STUDENT, URL_EMPTY_SEMESTER
@@ -162,26 +165,15 @@ def get_student(url_sid: str, url_semester: str):
         return return_val
 
     if url_semester != URL_EMPTY_SEMESTER:
-        with tracer.trace('process_rpc_result'):
-            cards: Dict[Tuple[int, int], List[Dict[str, str]]] = dict()
-            for card in student.cards:
-                day, time = lesson_string_to_tuple(card.lesson)
-                if (day, time) not in cards:
-                    cards[(day, time)] = list()
-                cards[(day, time)].append(card)
-            empty_5, empty_6, empty_sat, empty_sun = _empty_column_check(cards)
-            available_semesters = semester_calculate(url_semester, sorted(student.semesters))
-
-        return render_template('entity/student.html',
-                               have_semesters=True,
-                               student=student,
-                               cards=cards,
-                               empty_sat=empty_sat,
-                               empty_sun=empty_sun,
-                               empty_6=empty_6,
-                               empty_5=empty_5,
-                               available_semesters=available_semesters,
-                               current_semester=url_semester)
+        available_semesters = semester_calculate(url_semester, sorted(student.semesters))
+
+        return _render_page('entity/student.html',
+                            'student',
+                            have_semesters=True,
+                            student=student,
+                            timetable=_timetable_fragment('student', student_id, url_semester),
+                            available_semesters=available_semesters,
+                            current_semester=url_semester)
     else:
         # 无学期
         return render_template('entity/student.html',
@@ -216,28 +208,15 @@ def get_teacher(url_tid, url_semester):
             return handle_exception_with_error_page(e)
 
     if url_semester != URL_EMPTY_SEMESTER:
-        with tracer.trace('process_rpc_result'):
-            cards = defaultdict(list)
-            for card in teacher.cards:
-                day, time = lesson_string_to_tuple(card.lesson)
-                if (day, time) not in cards:
-                    cards[(day, time)] = list()
-                cards[(day, time)].append(card)
-
-        empty_5, empty_6, empty_sat, empty_sun = _empty_column_check(cards)
-
         available_semesters = semester_calculate(url_semester, teacher.semesters)
 
-        return render_template('entity/teacher.html',
-                               have_semesters=True,
-                               teacher=teacher,
-                               cards=cards,
-                               empty_sat=empty_sat,
-                               empty_sun=empty_sun,
-                               empty_6=empty_6,
-                               empty_5=empty_5,
-                               available_semesters=available_semesters,
-                               current_semester=url_semester)
+        return _render_page('entity/teacher.html',
+                            'teacher',
+                            have_semesters=True,
+                            teacher=teacher,
+                            timetable=_timetable_fragment('teacher', teacher_id, url_semester),
+                            available_semesters=available_semesters,
+                            current_semester=url_semester)
     else:
         # 无学期
         return render_template('entity/teacher.html',
@@ -263,25 +242,14 @@ def get_classroom(url_rid, url_semester):
     except Exception as e:
         return handle_exception_with_error_page(e)
 
-    with tracer.trace('process_rpc_result'):
-        cards = defaultdict(list)
-        for card in room.cards:
-            day, time = lesson_string_to_tuple(card.lesson)
-            cards[(day, time)].append(card)
-
-    empty_5, empty_6, empty_sat, empty_sun = _empty_column_check(cards)
-
     available_semesters = semester_calculate(url_semester, room.semesters)
 
-    return render_template('entity/room.html',
-                           room=room,
-                           cards=cards,
-                           empty_sat=empty_sat,
-                           empty_sun=empty_sun,
-                           empty_6=empty_6,
-                           empty_5=empty_5,
-                           available_semesters=available_semesters,
-                           current_semester=url_semester)
+    return _render_page('entity/room.html',
+                        'room',
+                        room=room,
+                        timetable=_timetable_fragment('room', room_id, url_semester),
+                        available_semesters=available_semesters,
+                        current_semester=url_semester)
 
 
 @entity_bp.route('/card/<string:url_cid>/<string:url_semester>')
@@ -329,6 +297,67 @@ def multi_people_schedule():
     return render_template("entity/multi_people_schedule.html")
 
 
+def _render_page(template: str, resource_type: str, **context) -> str:
+    """渲染课表页面，并记录渲染耗时"""
+    from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+
+    start = time.perf_counter()
+    page = render_template(template, **context)
+    if statsd:
+        statsd.distribution("entity.page.render_time", (time.perf_counter() - start) * 1000, tags=[f"type:{resource_type}"])
+    return page
+
+
+def _timetable_fragment(resource_type: str, identifier: str, semester: str) -> Markup:
+    """获取课表网格的 HTML 片段，并记录获取耗时（包含缓存未命中时的渲染）"""
+    from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+
+    start = time.perf_counter()
+    # 缓存键带有代码版本，模板修改后上线即失效
+    fragment = _render_timetable(app.config['GIT_HASH'], resource_type, identifier, semester)
+    if statsd:
+        statsd.distribution("entity.timetable.fragment_time", (time.perf_counter() - start) * 1000,
+                            tags=[f"type:{resource_type}"])
+    return fragment
+
+
+@cached("timetable_fragment")
+def _render_timetable(code_version: str, resource_type: str, identifier: str, semester: str) -> Markup:
+    """
+    渲染课表网格。同一资源同一学期的网格对所有访问者都相同，因此按数据版本缓存渲染结果。
+    与访问者相关的部分（权限检查、session）仍然在页面模板中每次渲染。
+    """
+    if resource_type == 'student':
+        entity = entity_service.get_student_timetable(identifier, semester)
+    elif resource_type == 'teacher':
+        entity = entity_service.get_teacher_timetable(identifier, semester)
+    else:
+        entity = entity_service.get_classroom_timetable(semester, identifier)
+
+    with tracer.trace('process_rpc_result'):
+        cards = _group_cards(entity.cards)
+    empty_5, empty_6, empty_sat, empty_sun = _empty_column_check(cards)
+
+    with tracer.trace('render_timetable'):
+        html = render_template('entity/_timetable.html',
+                               resource_type=resource_type,
+                               cards=cards,
+                               empty_sat=empty_sat,
+                               empty_sun=empty_sun,
+                               empty_6=empty_6,
+                               empty_5=empty_5,
+                               current_semester=semester)
+    return Markup(html)
+
+
+def _group_cards(cards: Iterable) -> Dict[Tuple[int, int], List]:
+    """按上课时间（星期, 节次）分组"""
+    grouped = defaultdict(list)
+    for card in cards:
+        grouped[lesson_string_to_tuple(card.lesson)].append(card)
+    return grouped
+
+
 def _empty_column_check(cards: dict) -> Tuple[bool, bool, bool, bool]:
     """检查是否周末和晚上有课，返回三个布尔值"""
     with tracer.trace('_empty_column_check'):
@@ -8,7 +8,8 @@ from everyclass.server.entity.model import SearchResultItem
 from everyclass.server.user import service as user_service
 from everyclass.server.utils import generate_error_response, api_helpers, generate_success_response
 from everyclass.server.utils.common_helpers import get_logged_in_uid, get_ut_uid
-from everyclass.server.utils.encryption import decrypt, RTYPE_ROOM
+from everyclass.server.utils.encryption import decrypt, decrypt_many, RTYPE_ROOM
+from everyclass.server.utils.jsonable import to_precomputed_json_response
 
 entity_api_bp = Blueprint('api_entity', __name__)
 
@@ -25,7 +26,7 @@ def multi_people_schedule():
     if not date:
         return generate_error_response(None, api_helpers.STATUS_CODE_INVALID_REQUEST, 'missing date parameter')
 
-    people_list = [decrypt(people)[1] for people in people_encoded.split(',')]
+    people_list = [identifier for _, identifier in decrypt_many(people_encoded.split(','))]
     date = datetime.date(*map(int, date.split('-')))
     schedule = entity_service.multi_people_schedule(people_list, date, uid)
     return generate_success_response(schedule)
@@ -45,7 +46,7 @@ def multi_people_schedule_search():
 
     print(f"session:{session.values()} \n uid:{uid}")
 
-    items = []
+    students = []
     for s in search_result.students:
         eligible = False
         groups = re.findall(r'\d+', s.klass)
@@ -56,17 +57,21 @@ def multi_people_schedule_search():
             eligible = True
 
         if eligible:
-            items.append(SearchResultItem(s.name, s.deputy + s.klass, "student", s.student_id_encoded,
-                                          *user_service.has_access(s.student_id, uid, False)))
+            students.append(s)
 
-    items.extend([SearchResultItem(t.name, t.unit + t.title, "teacher", t.teacher_id_encoded,
-                                   *user_service.has_access(t.teacher_id, uid, False)) for t in search_result.teachers])
+    # 一次性检查整页结果的访问权限
+    accesses = user_service.has_access_many([s.student_id for s in students] + [t.teacher_id for t in search_result.teachers], uid)
+
+    items = [SearchResultItem(s.name, s.deputy + s.klass, "student", s.student_id_encoded, *access)
+             for s, access in zip(students, accesses)]
+    items.extend([SearchResultItem(t.name, t.unit + t.title, "teacher", t.teacher_id_encoded, *access)
+                  for t, access in zip(search_result.teachers, accesses[len(students):])])
     return generate_success_response({'items': items, 'keyword': keyword, 'is_guest': True if uid is None else False})
 
 
 @entity_api_bp.route('/room')
 def get_all_rooms():
-    return generate_success_response(entity_service.get_rooms())
+    return to_precomputed_json_response(entity_service.get_rooms_json())
 
 
 @entity_api_bp.route('/room/_available')
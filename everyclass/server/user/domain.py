@@ -0,0 +1,44 @@
+"""
+密码哈希、验证与强度评分
+
+这些都是 CPU 密集的计算，在进程池中执行，避免开学登录高峰时占满 uWSGI 的请求线程。进程池繁忙时抛出 ProcessPoolBusy。
+"""
+from werkzeug.security import check_password_hash, generate_password_hash
+from zxcvbn import zxcvbn
+
+from everyclass.server.utils.concurrency import run_in_process
+from everyclass.server.utils.config import get_config
+
+STRENGTH_CHECK_MAX_LENGTH = 72  # zxcvbn 的耗时随长度快速增长，只评估前 72 个字符（新版本的 zxcvbn 本身也限制为 72 个字符）
+
+
+def hash_password(password: str) -> str:
+    """使用 PASSWORD_HASH_METHOD 配置的参数计算密码哈希"""
+    config = get_config()
+    return run_in_process(generate_password_hash, password, config.PASSWORD_HASH_METHOD, config.PASSWORD_SALT_LENGTH)
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    return run_in_process(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """
+    哈希的方法、迭代次数或盐长度与当前配置不同时返回 True
+
+    >>> needs_rehash("pbkdf2:sha256:50000$abcdefgh$0123")
+    True
+    """
+    config = get_config()
+    method, _, rest = password_hash.partition('$')
+    salt = rest.partition('$')[0]
+    return method != config.PASSWORD_HASH_METHOD or len(salt) != config.PASSWORD_SALT_LENGTH
+
+
+def score_password_strength(password: str) -> int:
+    return run_in_process(_zxcvbn_score, password[:STRENGTH_CHECK_MAX_LENGTH])
+
+
+def _zxcvbn_score(password: str) -> int:
+    """在子进程中执行，只返回分数，避免传回 zxcvbn 完整的分析结果"""
+    return zxcvbn(password=password)['score']
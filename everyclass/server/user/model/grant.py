@@ -1,10 +1,12 @@
-from typing import List, Optional
+from typing import FrozenSet, List, Optional
 
 from sqlalchemy import Column, String, DateTime, Integer
 from sqlalchemy.dialects.postgresql import ENUM
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql import func
 
+from everyclass.server.utils.cache import MISSING, TwoTierCache
+from everyclass.server.utils.config import get_config
 from everyclass.server.utils.db.postgres import Base, db_session
 from everyclass.server.utils.encryption import encrypt, RTYPE_STUDENT, RTYPE_TEACHER
 from everyclass.server.utils.jsonable import JSONSerializable
@@ -16,6 +18,11 @@ GRANT_STATUS_VALID = 'valid'
 GRANT_STATUS_REVOKED = 'revoked'
 GRANT_STATUS_REJECTED = 'rejected'
 
+# 以访问者为 key 缓存其获得授权的用户集合。授权状态变化时重新查询并写入缓存，未命中时用 SET NX 回填，
+# 避免在状态变化提交前读到旧集合的回填覆盖新值。其他进程内的本地缓存最多在 ACCESS_CACHE_LOCAL_TTL 秒后更新
+_granted_cache = TwoTierCache("granted_users", get_config().ACCESS_CACHE_LOCAL_SIZE, get_config().ACCESS_CACHE_TTL,
+                              local_ttl=get_config().ACCESS_CACHE_LOCAL_TTL)
+
 
 class Grant(Base, JSONSerializable):
     """用户对用户的授权
@@ -57,6 +64,7 @@ class Grant(Base, JSONSerializable):
             raise ValueError(f"status {self.status} cannot be transformed to valid")
         db_session.add(self)
         db_session.commit()
+        _granted_cache.set(self.user_id, self._query_granted_users(self.user_id))
 
     def reject(self):
         if self.status == GRANT_STATUS_PENDING:
@@ -65,21 +73,30 @@ class Grant(Base, JSONSerializable):
             raise ValueError(f"status {self.status} cannot be transformed to valid")
         db_session.add(self)
         db_session.commit()
+        _granted_cache.set(self.user_id, self._query_granted_users(self.user_id))
 
     @classmethod
     def has_grant(cls, user_id: str, to_user_id: str) -> bool:
         """检查是否有访问授权，user_id为访问的人，to_user_id为被访问的人"""
-        try:
-            result = db_session.query(cls). \
-                filter(cls.user_id == user_id). \
-                filter(cls.to_user_id == to_user_id). \
-                filter(cls.status == GRANT_STATUS_VALID).all()
-            if len(result) > 0:
-                return True
-            else:
-                return False
-        except NoResultFound:
-            return False
+        return to_user_id in cls.get_granted_users(user_id)
+
+    @classmethod
+    def get_granted_users(cls, user_id: str) -> FrozenSet[str]:
+        """获得授权 user_id 访问的所有用户。结果会被缓存，授权状态变化时更新"""
+        granted = _granted_cache.get(user_id)
+        if granted is MISSING:
+            granted = cls._query_granted_users(user_id)
+            if not _granted_cache.add(user_id, granted):
+                cached = _granted_cache.get_remote(user_id)
+                granted = granted if cached is MISSING else cached
+        return granted
+
+    @classmethod
+    def _query_granted_users(cls, user_id: str) -> FrozenSet[str]:
+        rows = db_session.query(cls.to_user_id). \
+            filter(cls.user_id == user_id). \
+            filter(cls.status == GRANT_STATUS_VALID).all()
+        return frozenset(row.to_user_id for row in rows)
 
     @classmethod
     def request_for_grant(cls, user_id: str, to_user_id: str) -> "Grant":
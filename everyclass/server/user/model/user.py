@@ -4,9 +4,10 @@ from typing import Optional
 from sqlalchemy import Column, String, DateTime
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
-from werkzeug.security import check_password_hash, generate_password_hash
 
+from everyclass.server.user.domain import hash_password, needs_rehash, verify_password
 from everyclass.server.user.exceptions import AlreadyRegisteredError
+from everyclass.server.utils.concurrency import ProcessPoolBusy
 from everyclass.server.utils.db.postgres import Base, db_session
 
 
@@ -21,8 +22,17 @@ class User(Base):
         return "<User(identifier='%s')>" % self.identifier
 
     def check_password(self, password: str) -> bool:
-        """检查密码是否正确"""
-        return check_password_hash(self.password, password)
+        """检查密码是否正确。哈希参数与当前配置不同时，验证通过后用当前配置重新计算哈希"""
+        if not verify_password(self.password, password):
+            return False
+
+        if needs_rehash(self.password):
+            try:
+                self.password = hash_password(password)
+                db_session.commit()
+            except ProcessPoolBusy:
+                pass  # 繁忙时跳过升级，不影响本次登录，下次登录时再升级
+        return True
 
     @classmethod
     def add_user(cls, identifier: str, password: str, password_encrypted: bool = False) -> None:
@@ -33,7 +43,7 @@ class User(Base):
         :param password_encrypted: 密码是否已经被加密过了（否则会被二次加密）
         """
         if not password_encrypted:
-            password_hash = generate_password_hash(password)
+            password_hash = hash_password(password)
         else:
             password_hash = password
 
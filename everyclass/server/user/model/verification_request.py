@@ -5,8 +5,8 @@ from sqlalchemy import Column, String, DateTime
 from sqlalchemy.dialects.postgresql import UUID, ENUM, HSTORE
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql import func
-from werkzeug.security import generate_password_hash
 
+from everyclass.server.user.domain import hash_password
 from everyclass.server.utils.base_exceptions import InvalidRequestException
 from everyclass.server.utils.db.postgres import Base, db_session
 
@@ -84,7 +84,7 @@ class VerificationRequest(Base):
 
         extra_doc = {}
         if password:
-            extra_doc.update({"password": generate_password_hash(password)})
+            extra_doc.update({"password": hash_password(password)})
 
         request = VerificationRequest(request_id=request_id, identifier=identifier, method=verification_method,
                                       status=status, extra=extra_doc)
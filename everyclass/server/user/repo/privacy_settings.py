@@ -1,15 +1,50 @@
 import datetime
+from typing import Dict, Iterable
 
+from everyclass.server.utils.cache import MISSING, TwoTierCache
 from everyclass.server.utils.config import get_config
 from everyclass.server.utils.db import pg_conn_context
 
+_config = get_config()
+# 隐私级别只会被用户自己修改，修改时同步写入缓存。其他进程内的本地缓存最多在 ACCESS_CACHE_LOCAL_TTL 秒后更新。
+# 缓存未命中时用 SET NX 回填：并发读取者可能在修改提交前读到旧的（更宽松的）级别，回填不能覆盖 set_level 写入的新级别
+_level_cache = TwoTierCache("privacy_level", _config.ACCESS_CACHE_LOCAL_SIZE, _config.ACCESS_CACHE_TTL,
+                            local_ttl=_config.ACCESS_CACHE_LOCAL_TTL)
+
 
 def get_level(student_id: str) -> int:
+    level = _level_cache.get(student_id)
+    if level is not MISSING:
+        return level
+
     with pg_conn_context() as conn, conn.cursor() as cursor:
         select_query = "SELECT level FROM privacy_settings WHERE student_id=%s"
         cursor.execute(select_query, (student_id,))
         result = cursor.fetchone()
-    return result[0] if result is not None else get_config().DEFAULT_PRIVACY_LEVEL
+    level = result[0] if result is not None else get_config().DEFAULT_PRIVACY_LEVEL
+    if not _level_cache.add(student_id, level):
+        level = _reread(student_id, level)
+    return level
+
+
+def get_levels(student_ids: Iterable[str]) -> Dict[str, int]:
+    """批量获取隐私级别，缓存未命中的部分使用一次查询获得"""
+    student_ids = set(student_ids)
+    levels = _level_cache.get_many(student_ids)
+    missing = [student_id for student_id in student_ids if student_id not in levels]
+    if not missing:
+        return levels
+
+    with pg_conn_context() as conn, conn.cursor() as cursor:
+        select_query = "SELECT student_id, level FROM privacy_settings WHERE student_id = ANY(%s)"
+        cursor.execute(select_query, (missing,))
+        fetched = dict(cursor.fetchall())
+    fetched = {student_id: fetched.get(student_id, get_config().DEFAULT_PRIVACY_LEVEL) for student_id in missing}
+    for student_id in _level_cache.set_many(fetched, nx=True):
+        fetched[student_id] = _reread(student_id, fetched[student_id])
+
+    levels.update(fetched)
+    return levels
 
 
 def set_level(student_id: str, new_level: int) -> None:
@@ -20,3 +55,10 @@ def set_level(student_id: str, new_level: int) -> None:
         """
         cursor.execute(insert_query, (student_id, new_level, datetime.datetime.now()))
         conn.commit()
+    _level_cache.set(student_id, new_level)
+
+
+def _reread(student_id: str, level: int) -> int:
+    """回填失败说明读数据库期间级别被修改过，以缓存中 set_level 写入的值为准"""
+    cached = _level_cache.get_remote(student_id)
+    return level if cached is MISSING else cached
@@ -1,13 +1,35 @@
+import os
+import threading
+from collections import deque
+from typing import Deque, List
+
+from everyclass.server.utils.config import get_config
 from everyclass.server.utils.db import pg_conn_context
 
+_reserved: Deque[int] = deque()
+_reserved_pid = None  # 预留号段的进程。fork 出的子进程不能继续使用父进程预留的号段，否则会分配出重复的 ID
+_lock = threading.Lock()
+
+
+def new() -> int:
+    """从进程内预留的号段中分配一个 ID，号段用完时一次性从序列中预留 USER_ID_BLOCK_SIZE 个。ID 唯一但不保证全局递增"""
+    global _reserved_pid
+    with _lock:
+        if _reserved_pid != os.getpid():
+            _reserved.clear()
+            _reserved_pid = os.getpid()
+        if not _reserved:
+            _reserved.extend(_reserve(get_config().USER_ID_BLOCK_SIZE))
+        return _reserved.popleft()
+
 
-def new():
+def _reserve(count: int) -> List[int]:
     with pg_conn_context() as conn, conn.cursor() as cursor:
-        get_sequence_query = """SELECT nextval('user_id_seq')"""
-        cursor.execute(get_sequence_query)
-        num = cursor.fetchone()[0]
+        get_sequence_query = """SELECT nextval('user_id_seq') FROM generate_series(1, %s)"""
+        cursor.execute(get_sequence_query, (count,))
+        nums = [row[0] for row in cursor.fetchall()]
 
-    return num
+    return sorted(nums)
 
 
 def init_table() -> None:
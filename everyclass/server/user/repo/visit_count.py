@@ -1,5 +1,10 @@
+from collections import defaultdict
+from typing import Dict, Tuple
+
 from flask import session
 
+from everyclass.server.utils.batching import BufferedWriter
+from everyclass.server.utils.config import get_config
 from everyclass.server.utils.db.redis import redis, redis_prefix
 
 
@@ -11,7 +16,26 @@ def add_visitor_count(identifier: str, visitor: str = None) -> None:
         if identifier != visitor:  # 排除自己的访问量
             return
         visitor_identifier = visitor
-    redis.pfadd("{}:visit_cnt:{}".format(redis_prefix, identifier), visitor_identifier)
+    # 写入先进入缓冲区，由后台线程批量写入 Redis，缓冲区满时丢弃
+    _count_writer.put((identifier, visitor_identifier), None)
+
+
+def _flush_counts(batch: Dict[Tuple[str, str], None]) -> None:
+    """按被访问者合并后，使用一次 pipeline 批量 PFADD"""
+    visitors = defaultdict(list)
+    for identifier, visitor_identifier in batch:
+        visitors[identifier].append(visitor_identifier)
+
+    with redis.pipeline(transaction=False) as pipe:
+        for identifier, visitor_identifiers in visitors.items():
+            pipe.pfadd("{}:visit_cnt:{}".format(redis_prefix, identifier), *visitor_identifiers)
+        pipe.execute()
+
+
+_count_writer = BufferedWriter("visit_count", _flush_counts,
+                               interval=get_config().FOOTPRINT_FLUSH_INTERVAL,
+                               max_batch=get_config().FOOTPRINT_FLUSH_BATCH,
+                               max_pending=get_config().FOOTPRINT_MAX_PENDING)
 
 
 def get_visitor_count(identifier: str) -> int:
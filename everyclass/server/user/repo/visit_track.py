@@ -1,19 +1,37 @@
 import datetime
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 
+from psycopg2.extras import execute_values
+
+from everyclass.server.utils.batching import BufferedWriter
+from everyclass.server.utils.config import get_config
 from everyclass.server.utils.db import pg_conn_context
 
 
 def update_track(host: str, visitor: str) -> None:
+    """记录访问轨迹。写入先进入缓冲区，由后台线程批量写入数据库，缓冲区满时丢弃"""
+    _track_writer.put((host, visitor), datetime.datetime.now())
+
+
+def _flush_tracks(batch: Dict[Tuple[str, str], datetime.datetime]) -> None:
+    """批量写入访问轨迹。缓冲区按 (host, visitor) 合并，同一批次中不会有重复的行"""
     with pg_conn_context() as conn, conn.cursor() as cursor:
         insert_or_update_query = """
-        INSERT INTO visit_tracks (host_id, visitor_id, last_visit_time) VALUES (%s,%s,%s)
+        INSERT INTO visit_tracks (host_id, visitor_id, last_visit_time) VALUES %s
             ON CONFLICT ON CONSTRAINT unq_host_visitor DO UPDATE SET last_visit_time=EXCLUDED.last_visit_time;
         """
-        cursor.execute(insert_or_update_query, (host, visitor, datetime.datetime.now()))
+        # 按主键排序，避免不同进程同时写入相同的行时死锁
+        execute_values(cursor, insert_or_update_query,
+                       [(host, visitor, visit_time) for (host, visitor), visit_time in sorted(batch.items())])
         conn.commit()
 
 
+_track_writer = BufferedWriter("visit_track", _flush_tracks,
+                               interval=get_config().FOOTPRINT_FLUSH_INTERVAL,
+                               max_batch=get_config().FOOTPRINT_FLUSH_BATCH,
+                               max_pending=get_config().FOOTPRINT_MAX_PENDING)
+
+
 def get_visitors(identifier: str) -> List[Tuple[str, int]]:
     """获得学生访客列表，包含访客的学号或教工号及访问时间"""
     with pg_conn_context() as conn, conn.cursor() as cursor:
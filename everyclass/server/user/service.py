@@ -1,20 +1,27 @@
+import hashlib
+import threading
+import time
 import uuid
-from typing import Optional, Tuple, List, Dict
+from typing import Callable, Optional, Tuple, List, Dict
 
 import jwt
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
 from ddtrace import tracer
 from flask import session
-from zxcvbn import zxcvbn
 
 from everyclass.rpc import RpcServerException
 from everyclass.rpc.auth import Auth
 from everyclass.server import logger
 from everyclass.server.entity import service as entity_service
+from everyclass.server.user import domain
 from everyclass.server.user.exceptions import RecordNotFound, NoPermissionToAccept, UserNotExists, \
     AlreadyRegisteredError, InvalidTokenError, IdentityVerifyRequestNotFoundError, PasswordTooWeakError, IdentityVerifyRequestStatusError
 from everyclass.server.user.model import User, VerificationRequest, SimplePassword, Visitor, Grant
 from everyclass.server.user.repo import privacy_settings, visit_count, user_id_sequence, visit_track
 from everyclass.server.utils.base_exceptions import InternalError
+from everyclass.server.utils.cache import LRUCache
+from everyclass.server.utils.config import get_config
 from everyclass.server.utils.session import USER_TYPE_TEACHER, USER_TYPE_STUDENT
 
 """Registration and Login"""
@@ -32,7 +39,7 @@ def check_password(identifier: str, password: str) -> bool:
     user = User.get_by_id(identifier)
     if not user:
         raise UserNotExists
-    return User.get_by_id(identifier).check_password(password)
+    return user.check_password(password)
 
 
 def record_simple_password(password: str, identifier: str) -> None:
@@ -156,7 +163,7 @@ def register_by_password_status_refresh(request_id: str) -> Tuple[bool, str, Opt
 
 
 def score_password_strength(password: str) -> int:
-    return zxcvbn(password=password)['score']
+    return domain.score_password_strength(password)
 
 
 """Privacy"""
@@ -184,6 +191,28 @@ def has_access(host: str, visitor: Optional[str] = None, footprint: bool = True)
         return True, None
 
     privacy_level = get_privacy_level(host)
+    can, reason = _check_privacy_level(host, visitor, privacy_level, lambda: get_privacy_level(visitor))
+    if not can:
+        return can, reason
+
+    # 公开或实名互访模式、已登录、不是自己访问自己，则留下轨迹
+    if footprint and privacy_level != 2 and visitor and visitor != host:
+        _update_track(host=host, visitor=visitor)
+        _add_visitor_count(host=host, visitor=visitor)
+    return True, None
+
+
+def has_access_many(hosts: List[str], visitor: Optional[str] = None) -> List[Tuple[bool, Optional[str]]]:
+    """批量检查访问者是否有权限访问多个用户，不留下访问记录。隐私级别和授权最多各查询一次数据库，结果与 hosts 顺序一致"""
+    levels = privacy_settings.get_levels(hosts + [visitor] if visitor else hosts)
+    granted = Grant.get_granted_users(visitor) if visitor else frozenset()
+    return [(True, None) if host in granted else _check_privacy_level(host, visitor, levels[host], lambda: levels[visitor])
+            for host in hosts]
+
+
+def _check_privacy_level(host: str, visitor: Optional[str], privacy_level: int,
+                         get_visitor_level: Callable[[], int]) -> Tuple[bool, Optional[str]]:
+    """根据被访问者的隐私级别判断是否可以访问。访问者的隐私级别只在需要时获取"""
     # 仅自己可见、且未登录或登录用户非在查看的用户，拒绝访问
     if privacy_level == 2 and (not visitor or visitor != host):
         return False, REASON_SELF_ONLY
@@ -194,13 +223,8 @@ def has_access(host: str, visitor: Optional[str] = None, footprint: bool = True)
         if not visitor:
             return False, REASON_LOGIN_REQUIRED
         # 仅自己可见的用户访问实名互访的用户，拒绝，要求调整自己的权限
-        if get_privacy_level(visitor) == 2:
+        if get_visitor_level() == 2:
             return False, REASON_PERMISSION_ADJUST_REQUIRED
-
-    # 公开或实名互访模式、已登录、不是自己访问自己，则留下轨迹
-    if footprint and privacy_level != 2 and visitor and visitor != host:
-        _update_track(host=host, visitor=visitor)
-        _add_visitor_count(host=host, visitor=visitor)
     return True, None
 
 
@@ -212,7 +236,10 @@ def new_grant_request(from_uid: str, to_uid: str):
 
 
 def get_pending_requests(user_identifier: str):
-    return Grant.get_requests(user_identifier)
+    grants = Grant.get_requests(user_identifier)
+    # 预先批量查询申请人信息，Grant 序列化时可直接命中缓存
+    entity_service.get_people_info_batch([grant.user_id for grant in grants])
+    return grants
 
 
 def accept_grant(grant_id: int, current_user_id: str):
@@ -252,22 +279,25 @@ def get_visitor_count(identifier: str) -> int:
 def get_visitors(identifier: str) -> List[Visitor]:
     result = visit_track.get_visitors(identifier)
 
+    # query entity to get rich results
+    people_infos = entity_service.get_people_info_batch([record[0] for record in result])
+
     visitor_list = []
-    for record in result:
-        # query entity to get rich results
-        # todo: entity add a multi GET interface to make this process faster when the list is long
-        search_result = entity_service.search(record[0])
-        if len(search_result.students) > 0:
-            visitor_list.append(Visitor(name=search_result.students[0].name,
+    for record, people_info in zip(result, people_infos):
+        if not people_info:
+            continue
+        is_student, people = people_info
+        if is_student:
+            visitor_list.append(Visitor(name=people.name,
                                         user_type=USER_TYPE_STUDENT,
-                                        identifier_encoded=search_result.students[0].student_id_encoded,
-                                        last_semester=search_result.students[0].semesters[-1],
+                                        identifier_encoded=people.student_id_encoded,
+                                        last_semester=people.semesters[-1],
                                         visit_time=record[1]))
-        elif len(search_result.teachers) > 0:
-            visitor_list.append(Visitor(name=search_result.teachers[0].name,
+        else:
+            visitor_list.append(Visitor(name=people.name,
                                         user_type=USER_TYPE_TEACHER,
-                                        identifier_encoded=search_result.teachers[0].teacher_id_encoded,
-                                        last_semester=search_result.teachers[0].semesters[-1],
+                                        identifier_encoded=people.teacher_id_encoded,
+                                        last_semester=people.semesters[-1],
                                         visit_time=record[1]))
     return visitor_list
 
@@ -285,13 +315,41 @@ def get_user_id() -> int:
 """JWT Token"""
 
 
-def issue_token(user_identifier: str) -> str:
-    """签发指定用户名的JWT token"""
-    from everyclass.server.utils.config import get_config
+_jwt_keys: Dict[str, Tuple] = {}
+_jwt_keys_lock = threading.Lock()
+_jwt_payload_cache = LRUCache(get_config().JWT_CACHE_SIZE, get_config().JWT_CACHE_TTL)
+
+
+def _get_jwt_keys(algorithm: str) -> Tuple:
+    """
+    返回 (签名密钥, 验证密钥)。RSA 密钥只在第一次使用时从 PEM 解析，避免每次验证都重新解析配置中的公钥
+
+    :raises ValueError: 算法不可用（HS256 未配置密钥或不支持的算法）
+    """
+    try:
+        return _jwt_keys[algorithm]
+    except KeyError:
+        pass
+
     config = get_config()
+    with _jwt_keys_lock:
+        if algorithm not in _jwt_keys:
+            if algorithm == 'RS256':
+                _jwt_keys[algorithm] = (load_pem_private_key(config.JWT_PRIVATE_KEY.encode(), password=None, backend=default_backend()),
+                                        load_pem_public_key(config.JWT_PUBLIC_KEY.encode(), backend=default_backend()))
+            elif algorithm == 'HS256' and config.JWT_HMAC_SECRET:
+                _jwt_keys[algorithm] = (config.JWT_HMAC_SECRET, config.JWT_HMAC_SECRET)
+            else:
+                raise ValueError(f"JWT algorithm {algorithm} is not available")
+        return _jwt_keys[algorithm]
+
+
+def issue_token(user_identifier: str) -> str:
+    """签发指定用户名的JWT token，算法由 JWT_ALGORITHM 配置"""
+    algorithm = get_config().JWT_ALGORITHM
 
     payload = {"username": user_identifier}
-    token = jwt.encode(payload, config.JWT_PRIVATE_KEY, algorithm='RS256')
+    token = jwt.encode(payload, _get_jwt_keys(algorithm)[0], algorithm=algorithm)
 
     return token.decode('utf8')
 
@@ -300,11 +358,29 @@ def decode_jwt_payload(token: str) -> Dict:
     """验证JWT Token并解出payload
 
     如果payload被修改，抛出jwt.exceptions.InvalidSignatureError。如果签名被修改，抛出jwt.exceptions.DecodeError
+
+    验证通过的 payload 按 token 的摘要缓存在进程内，有效期内再次验证同一个 token 不需要再做签名验证。
+    根据 token 头部的算法选择密钥，RS256 始终可用，HS256 只在配置了 JWT_HMAC_SECRET 时接受，因此切换签发算法后旧 token 仍然有效。
     """
-    from everyclass.server.utils.config import get_config
-    config = get_config()
+    if not isinstance(token, str):
+        raise jwt.exceptions.DecodeError("Invalid token type")
+
+    cache_key = hashlib.sha256(token.encode()).digest()
+    payload = _jwt_payload_cache.get(cache_key, None)
+    if payload is not None:
+        return dict(payload)
 
-    return jwt.decode(token, config.JWT_PUBLIC_KEY, algorithms=['RS256'])
+    algorithm = jwt.get_unverified_header(token).get('alg')
+    try:
+        verify_key = _get_jwt_keys(algorithm)[1]
+    except ValueError as e:
+        raise jwt.exceptions.InvalidAlgorithmError(str(e))
+    payload = jwt.decode(token, verify_key, algorithms=[algorithm])
+
+    # 带有过期时间的 token 不能在过期后仍然命中缓存
+    if 'exp' not in payload or payload['exp'] > time.time() + get_config().JWT_CACHE_TTL:
+        _jwt_payload_cache.set(cache_key, payload)
+    return dict(payload)
 
 
 def get_username_from_jwt(token: str) -> Optional[str]:
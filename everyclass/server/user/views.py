@@ -7,9 +7,10 @@ from everyclass.server import logger
 from everyclass.server.calendar import service as calendar_service
 from everyclass.server.entity import service as entity_service
 from everyclass.server.user import service as user_service
+from everyclass.server.utils.concurrency import ProcessPoolBusy
 from everyclass.server.utils.session import USER_TYPE_TEACHER, USER_TYPE_STUDENT, UserSession
 from everyclass.server.utils.web_consts import MSG_400, MSG_ALREADY_REGISTERED, MSG_EMPTY_PASSWORD, MSG_EMPTY_USERNAME, \
-    MSG_INVALID_CAPTCHA, MSG_NOT_REGISTERED, MSG_PWD_DIFFERENT, MSG_REGISTER_SUCCESS, \
+    MSG_INVALID_CAPTCHA, MSG_NOT_REGISTERED, MSG_PWD_DIFFERENT, MSG_REGISTER_SUCCESS, MSG_SERVER_BUSY, \
     MSG_TOKEN_INVALID, MSG_USERNAME_NOT_EXIST, MSG_VIEW_SCHEDULE_FIRST, MSG_WEAK_PASSWORD, MSG_WRONG_PASSWORD, \
     SESSION_CURRENT_USER, SESSION_EMAIL_VER_REQ_ID, SESSION_LAST_VIEWED_STUDENT, SESSION_PWD_VER_REQ_ID, \
     SESSION_USER_REGISTERING
@@ -67,6 +68,9 @@ def login():
             # 未注册
             flash(MSG_NOT_REGISTERED)
             return redirect(url_for("user.register"))
+        except ProcessPoolBusy:
+            flash(MSG_SERVER_BUSY)
+            return redirect(url_for("user.login"))
 
         if success:
             try:
@@ -159,6 +163,9 @@ def email_verification():
         except everyclass.server.user.exceptions.AlreadyRegisteredError:
             flash(MSG_ALREADY_REGISTERED)
             return redirect(url_for("user.email_verification"))
+        except ProcessPoolBusy:
+            flash(MSG_SERVER_BUSY)
+            return redirect(url_for("user.email_verification"))
 
         del session[SESSION_EMAIL_VER_REQ_ID]
         flash(MSG_REGISTER_SUCCESS)
@@ -222,7 +229,10 @@ def password_strength_check():
     """AJAX 密码强度检查"""
     if request.form.get("password", None):
         # 密码强度检查
-        score = user_service.score_password_strength(request.form["password"])
+        try:
+            score = user_service.score_password_strength(request.form["password"])
+        except ProcessPoolBusy:
+            return jsonify({"busy": True})
         if score < 2:
             return jsonify({"strong": False,
                             "score": score})
@@ -315,9 +325,8 @@ def main():
         return handle_exception_with_error_page(e)
 
     pending_grant_reqs = user_service.get_pending_requests(session[SESSION_CURRENT_USER].identifier)
-    pending_grant_names = []
-    for req in pending_grant_reqs:
-        pending_grant_names.append(entity_service.get_people_info(req.user_id)[1].name)
+    pending_grant_names = [people_info[1].name for people_info in
+                           entity_service.get_people_info_batch([req.user_id for req in pending_grant_reqs]) if people_info]
 
     return render_template('user/main.html',
                            name=session[SESSION_CURRENT_USER].name,
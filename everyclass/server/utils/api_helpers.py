@@ -16,6 +16,7 @@ STATUS_CODE_PERMISSION_DENIED = 4003
 
 # 服务器内部错误
 STATUS_CODE_INTERNAL_ERROR = 5000
+STATUS_CODE_SERVER_BUSY = 5001
 
 # 错误码对应的 status message
 # 领域内业务错误的 status message 不用定义在这里
@@ -24,6 +25,7 @@ STATUS_MESSAGES = {
     STATUS_CODE_TOKEN_MISSING: 'token is missing',
     STATUS_CODE_INVALID_TOKEN: 'token is invalid',
     STATUS_CODE_INTERNAL_ERROR: 'internal error',
+    STATUS_CODE_SERVER_BUSY: 'server busy',
 }
 
 
@@ -0,0 +1,89 @@
+"""
+进程内的延迟批量写入
+
+热点路径上的非关键写入（如最后使用时间）先放入内存缓冲区，相同 key 只保留最后一次的值，由后台线程定期批量写入数据库。
+进程异常退出时最多丢失一个刷新周期（或 max_batch 条）的数据；正常退出时会把缓冲区中的数据写完。
+"""
+import atexit
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from everyclass.server import logger
+
+
+class BufferedWriter:
+    """
+    按 key 合并的缓冲写入器
+
+    :param name: 名称，用于日志和 statsd 指标
+    :param flush_func: 批量写入函数，参数为 {key: value} 字典
+    :param interval: 刷新周期（秒）
+    :param max_batch: 缓冲区达到这个大小时立即刷新
+    :param max_pending: 缓冲区上限，超出时丢弃新数据并记录指标。为 None 时不限制
+    """
+
+    def __init__(self, name: str, flush_func: Callable[[Dict[Hashable, Any]], None], interval: float, max_batch: int,
+                 max_pending: Optional[int] = None):
+        self.name = name
+        self.flush_func = flush_func
+        self.interval = interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+
+        self._pending: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def put(self, key: Hashable, value: Any) -> bool:
+        """放入缓冲区，返回是否成功（缓冲区已满时返回 False）"""
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            if self.max_pending is not None and len(self._pending) >= self.max_pending and key not in self._pending:
+                pending = None
+            else:
+                self._pending[key] = value
+                pending = len(self._pending)
+
+        if pending is None:
+            _increment(f"batching.{self.name}.dropped")
+            return False
+        if pending >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    def flush(self) -> None:
+        """立即写入缓冲区中的所有数据。写入失败的数据会被丢弃"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            try:
+                self.flush_func(batch)
+            except Exception as e:
+                _increment(f"batching.{self.name}.failed", len(batch))
+                logger.warning(f"failed to flush {self.name}", extra={"error": repr(e), "size": len(batch)})
+            else:
+                _increment(f"batching.{self.name}.flushed", len(batch))
+
+    def _start(self) -> None:
+        """第一次写入时才启动后台线程，保证线程在 uWSGI fork 之后的 worker 进程中创建"""
+        self._thread = threading.Thread(target=self._run, name=f"flush_{self.name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)  # uWSGI worker 正常退出时也会执行 atexit
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def _increment(metric: str, value: int = 1) -> None:
+    from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+
+    if statsd:
+        statsd.increment(metric, value)
@@ -0,0 +1,358 @@
+"""
+进程内 LRU + Redis 两级缓存
+
+- 第一级为每个 uWSGI worker 进程内的有界 LRU，命中时没有任何 I/O
+- 第二级为 Redis，所有 worker 共享，值使用 pickle 序列化
+- 与数据相关的缓存键中带有数据版本（DATA_LAST_UPDATE_TIME），数据更新后旧键自然失效，无需逐个删除
+- 缓存未命中时使用 single-flight 合并相同 key 的并发请求，避免热点数据失效瞬间大量请求同时打到上游
+"""
+import functools
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Set
+
+from flask import current_app, has_app_context
+from redis.exceptions import RedisError
+
+from everyclass.server.utils.config import get_config
+from everyclass.server.utils.db.redis import redis, redis_prefix
+
+MISSING = object()  # 缓存未命中的标记，区别于被缓存的 None
+
+
+class LRUCache:
+    """线程安全的有界 LRU 缓存，可选过期时间（秒）"""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            try:
+                expire_at, value = self._data[key]
+            except KeyError:
+                return default
+            if expire_at is not None and expire_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """ttl 为这一条目的过期时间，默认使用构造时的 ttl"""
+        ttl = ttl or self.ttl
+        expire_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expire_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache:
+    """
+    进程内 LRU 在前、Redis 在后的两级缓存。Redis 不可用时退化为单级缓存，不影响业务
+
+    设置了 negative_ttl 时，值为 None 的条目（表示"不存在"）在两级缓存中都只保留 negative_ttl 秒。
+    """
+
+    def __init__(self, namespace: str, maxsize: int, ttl: int, local_ttl: Optional[float] = None,
+                 negative_ttl: Optional[int] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.local = LRUCache(maxsize, local_ttl)
+
+    def _ttl_for(self, value: Any, ttl: Optional[int] = None) -> int:
+        if ttl:
+            return ttl
+        if value is None and self.negative_ttl:
+            return self.negative_ttl
+        return self.ttl
+
+    def _set_local(self, key: str, value: Any) -> None:
+        ttl = None
+        if value is None and self.negative_ttl:
+            ttl = min(self.negative_ttl, self.local.ttl) if self.local.ttl else self.negative_ttl
+        self.local.set(key, value, ttl)
+
+    def _redis_key(self, key: str) -> str:
+        return f"{redis_prefix}:cache:{self.namespace}:{key}"
+
+    def get_remote(self, key: str) -> Any:
+        """只查询 Redis 层，不记录指标。未命中或 Redis 不可用时返回 MISSING"""
+        try:
+            raw = redis.get(self._redis_key(key))
+        except RedisError:
+            return MISSING
+        return pickle.loads(raw) if raw is not None else MISSING
+
+    def get(self, key: str) -> Any:
+        """获取缓存值，未命中返回 MISSING"""
+        value = self.local.get(key)
+        if value is not MISSING:
+            _report(self.namespace, "hit", "local")
+            return value
+
+        try:
+            raw = redis.get(self._redis_key(key))
+        except RedisError as e:
+            _log_redis_error(e)
+            raw = None
+        if raw is not None:
+            value = pickle.loads(raw)
+            self._set_local(key, value)
+            _report(self.namespace, "hit", "redis")
+            return value
+
+        _report(self.namespace, "miss")
+        return MISSING
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """写入缓存，ttl 为 Redis 层的过期时间，默认使用构造时的 ttl"""
+        self._set_local(key, value)
+        try:
+            redis.set(self._redis_key(key), pickle.dumps(value), ex=self._ttl_for(value, ttl))
+        except RedisError as e:
+            _log_redis_error(e)
+
+    def add(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        """
+        仅当 Redis 中不存在该 key 时写入（SET NX），用于缓存未命中后从数据库回填。
+
+        回填的值是在并发写入提交之前读到的，可能已经过期，不能覆盖写入路径写入的新值或删除标记。返回是否写入成功，
+        写入失败时进程内缓存也不更新。Redis 不可用时只写入进程内缓存。
+        """
+        try:
+            added = redis.set(self._redis_key(key), pickle.dumps(value), ex=self._ttl_for(value, ttl), nx=True)
+        except RedisError as e:
+            _log_redis_error(e)
+            added = True
+        if added:
+            self._set_local(key, value)
+        return bool(added)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """批量获取缓存值，进程内未命中的 key 使用一次 MGET 查询 Redis。返回值中只包含命中的 key"""
+        found = {}
+        remote_keys = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is not MISSING:
+                found[key] = value
+            else:
+                remote_keys.append(key)
+        _report(self.namespace, "hit", "local", len(found))
+
+        if remote_keys:
+            try:
+                raws = redis.mget([self._redis_key(key) for key in remote_keys])
+            except RedisError as e:
+                _log_redis_error(e)
+                raws = [None] * len(remote_keys)
+            remote_hits = 0
+            for key, raw in zip(remote_keys, raws):
+                if raw is not None:
+                    found[key] = pickle.loads(raw)
+                    self._set_local(key, found[key])
+                    remote_hits += 1
+            _report(self.namespace, "hit", "redis", remote_hits)
+            _report(self.namespace, "miss", None, len(remote_keys) - remote_hits)
+        return found
+
+    def set_many(self, mapping: Dict[str, Any], nx: bool = False) -> Set[str]:
+        """
+        批量写入缓存。nx 为 True 时与 add 相同，只写入 Redis 中不存在的 key
+
+        :return: 因为 Redis 中已存在而没有写入的 key
+        """
+        conflicts = set()
+        try:
+            with redis.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    pipe.set(self._redis_key(key), pickle.dumps(value), ex=self._ttl_for(value), nx=nx)
+                results = pipe.execute()
+            if nx:
+                conflicts = {key for key, added in zip(mapping, results) if not added}
+        except RedisError as e:
+            _log_redis_error(e)
+        for key, value in mapping.items():
+            if key not in conflicts:
+                self._set_local(key, value)
+        return conflicts
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        try:
+            redis.delete(self._redis_key(key))
+        except RedisError as e:
+            _log_redis_error(e)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """进程内的请求合并：同一 key 的并发调用只有第一个真正执行，其余线程等待并共享它的结果或异常"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not is_leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+def data_version() -> str:
+    """当前数据版本。api-server 数据更新后 DATA_LAST_UPDATE_TIME 随之变化"""
+    if has_app_context():
+        return str(current_app.config['DATA_LAST_UPDATE_TIME'])
+    return str(get_config().DATA_LAST_UPDATE_TIME)
+
+
+def make_key(*parts) -> str:
+    return ":".join(str(part) for part in parts)
+
+
+def cached(namespace: str, versioned: bool = True, negative_ttl: Optional[int] = None) -> Callable:
+    """
+    两级缓存装饰器，使用位置参数作为缓存键。抛出异常的调用不会被缓存。
+
+    未命中时，同一进程内相同 key 的并发调用会被合并为一次上游调用。如果开启了 SINGLE_FLIGHT_REDIS_LOCK，还会通过 Redis 中的
+    短锁在 worker 之间合并：拿不到锁的 worker 轮询 Redis 层等待持锁者写入结果，超时后再自行调用上游。
+
+    :param namespace: 缓存命名空间，同时用作 statsd 指标名的一部分
+    :param versioned: 缓存键是否带有数据版本
+    :param negative_ttl: 返回 None 的调用结果的缓存时间（秒），用于短时间缓存"不存在"的结果。默认与其他结果相同
+    """
+    config = get_config()
+
+    def decorator(func):
+        cache = TwoTierCache(namespace, config.ENTITY_CACHE_LOCAL_SIZE, config.ENTITY_CACHE_TTL, negative_ttl=negative_ttl)
+        flight = SingleFlight()
+
+        def load(key: str, args: tuple) -> Any:
+            lock_key = f"{redis_prefix}:flight:{namespace}:{key}"
+            lock_acquired = False
+            if config.SINGLE_FLIGHT_REDIS_LOCK:
+                try:
+                    lock_acquired = redis.set(lock_key, 1, nx=True, px=config.SINGLE_FLIGHT_LOCK_MS)
+                except RedisError as e:
+                    _log_redis_error(e)
+                    lock_acquired = True  # Redis 不可用时不等待，直接调用上游
+                if not lock_acquired:
+                    value = _wait_for_remote(cache, key, config.SINGLE_FLIGHT_LOCK_MS)
+                    if value is not MISSING:
+                        _report(namespace, "coalesced", "redis")
+                        cache._set_local(key, value)
+                        return value
+
+            try:
+                value = func(*args)
+                cache.set(key, value)
+                return value
+            finally:
+                if config.SINGLE_FLIGHT_REDIS_LOCK and lock_acquired:
+                    try:
+                        redis.delete(lock_key)
+                    except RedisError:
+                        pass
+
+        def key_for(*args) -> str:
+            return make_key(data_version(), *args) if versioned else make_key(*args)
+
+        @functools.wraps(func)
+        def wrapped(*args):
+            key = key_for(*args)
+            value = cache.get(key)
+            if value is not MISSING:
+                return value
+
+            return flight.do(key, lambda: load(key, args))
+
+        wrapped.cache = cache
+        wrapped.key_for = key_for
+        return wrapped
+
+    return decorator
+
+
+def single_flight(namespace: str) -> Callable:
+    """不带缓存的请求合并装饰器，使用位置参数作为 key，只在进程内合并"""
+
+    def decorator(func):
+        flight = SingleFlight()
+
+        @functools.wraps(func)
+        def wrapped(*args):
+            return flight.do(make_key(namespace, *args), lambda: func(*args))
+
+        return wrapped
+
+    return decorator
+
+
+def _wait_for_remote(cache: TwoTierCache, key: str, timeout_ms: int) -> Any:
+    """轮询 Redis 层，等待其他 worker 写入结果。超时返回 MISSING"""
+    deadline = time.monotonic() + timeout_ms / 1000
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        value = cache.get_remote(key)
+        if value is not MISSING:
+            return value
+    return MISSING
+
+
+def _report(namespace: str, result: str, tier: Optional[str] = None, count: int = 1) -> None:
+    from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+
+    if statsd and count:
+        statsd.increment(f"cache.{namespace}.{result}", count, tags=[f"tier:{tier}"] if tier else None)
+
+
+def _log_redis_error(e: Exception) -> None:
+    from everyclass.server import logger
+
+    logger.warning("redis cache unavailable", extra={"error": repr(e)})
@@ -0,0 +1,192 @@
+"""
+有界线程池与并发扇出，以及用于 CPU 密集任务的进程池
+
+线程池在第一次使用时才创建，保证在 uWSGI fork 之后的 worker 进程中创建，而不是在 master 进程中。
+注意不要在扇出的任务中再次调用 fan_out，否则线程池耗尽时会互相等待导致死锁。
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from ddtrace import tracer
+from flask import copy_current_request_context, current_app, has_app_context, has_request_context
+
+from everyclass.server.utils.api_helpers import STATUS_CODE_SERVER_BUSY
+from everyclass.server.utils.base_exceptions import BizException, InternalError
+from everyclass.server.utils.config import get_config
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=get_config().FAN_OUT_WORKERS, thread_name_prefix="fan_out")
+    return _executor
+
+
+def _in_context(func: Callable) -> Callable:
+    """让任务在线程池中运行时也能使用当前请求的 Flask 上下文（session、current_app 等），任务结束时上下文被弹出，
+    teardown_appcontext 会回收该线程的数据库 session"""
+    if has_request_context():
+        return copy_current_request_context(func)
+    if has_app_context():
+        app = current_app._get_current_object()
+
+        def run(*args):
+            with app.app_context():
+                return func(*args)
+
+        return run
+    return func
+
+
+def fan_out(func: Callable, args_list: Sequence[tuple], span_name: str, timeout: Optional[float] = None,
+            call_timeout: Optional[float] = None) -> List[Any]:
+    """
+    在线程池中并发执行 func(*args)，按 args_list 的顺序返回结果。任一任务抛出异常时，按顺序抛出第一个异常。
+
+    :param func: 要执行的函数
+    :param args_list: 每次调用的参数元组
+    :param span_name: APM 中每个任务的 span 名称
+    :param timeout: 整体超时时间（秒），默认使用 FAN_OUT_TIMEOUT。超时抛出 InternalError
+    :param call_timeout: 单个任务从开始执行算起的超时时间（秒），默认使用 FAN_OUT_CALL_TIMEOUT。在线程池中排队的时间不计入。
+                         超时抛出 InternalError，错误信息中包含该任务的参数
+    """
+    if not args_list:
+        return []
+    if timeout is None:
+        timeout = get_config().FAN_OUT_TIMEOUT
+    if call_timeout is None:
+        call_timeout = get_config().FAN_OUT_CALL_TIMEOUT
+
+    parent_span = tracer.current_span()
+    started_at: List[Optional[float]] = [None] * len(args_list)  # 每个任务开始执行的时间
+
+    def traced(i, *args):
+        started_at[i] = time.monotonic()
+        with tracer.start_span(span_name, child_of=parent_span):
+            return func(*args)
+
+    executor = get_executor()
+    futures = [executor.submit(_in_context(traced), i, *args) for i, args in enumerate(args_list)]
+
+    deadline = time.monotonic() + timeout
+
+    def wait(i: int) -> Any:
+        while True:
+            start = started_at[i]
+            # 任务还在排队时，最多等待 call_timeout 秒后重新检查它是否已经开始执行
+            until = min(deadline, (start if start is not None else time.monotonic()) + call_timeout)
+            try:
+                return futures[i].result(timeout=max(0.0, until - time.monotonic()))
+            except TimeoutError:
+                now = time.monotonic()
+                if now >= deadline:
+                    raise InternalError(f"{span_name} timed out after {timeout}s")
+                start = started_at[i]
+                if start is not None and now >= start + call_timeout:
+                    raise InternalError(f"{span_name}{tuple(args_list[i])} timed out after {call_timeout}s")
+
+    try:
+        return [wait(i) for i in range(len(futures))]
+    except BaseException:
+        for future in futures:
+            future.cancel()  # 只能取消还在排队的任务，已经开始执行的任务会在后台执行完
+        raise
+
+
+class ProcessPoolBusy(BizException):
+    """进程池中的任务过多，拒绝新任务。这是预期中的过载保护，不是 InternalError，不记录错误日志"""
+
+    def __init__(self):
+        super().__init__("服务器繁忙，请稍后再试", STATUS_CODE_SERVER_BUSY)
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_slots: Optional[threading.BoundedSemaphore] = None
+_process_pool_lock = threading.Lock()
+
+
+def start_process_pool() -> None:
+    """
+    创建进程池并启动子进程
+
+    子进程通过 fork 创建（uWSGI 中 sys.executable 不是 Python 解释器，无法使用 spawn），因此应当在 worker 进程 fork 之后、
+    开始处理请求之前调用，此时进程中还没有其他线程持有锁。没有调用时在第一次使用时创建。
+    """
+    if get_config().PROCESS_POOL_WORKERS:
+        _get_process_pool()
+
+
+def _get_process_pool() -> Tuple[ProcessPoolExecutor, threading.BoundedSemaphore]:
+    global _process_pool, _process_slots
+    with _process_pool_lock:
+        if _process_pool is None:
+            config = get_config()
+            _process_slots = threading.BoundedSemaphore(config.PROCESS_POOL_MAX_PENDING)
+            _process_pool = ProcessPoolExecutor(max_workers=config.PROCESS_POOL_WORKERS,
+                                                mp_context=multiprocessing.get_context("fork"))
+            _process_pool.submit(int).result()  # 提交一个空任务，让子进程立即启动
+        return _process_pool, _process_slots
+
+
+def _reset_process_pool(broken: ProcessPoolExecutor) -> None:
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is broken:
+            _process_pool = None
+    broken.shutdown(wait=False)
+
+
+def run_in_process(func: Callable, *args, timeout: Optional[float] = None) -> Any:
+    """
+    在进程池中执行 CPU 密集的函数并等待结果，避免长时间占用请求线程和 GIL。func、参数和返回值都需要能被 pickle。
+
+    进程池中正在执行和排队的任务数达到 PROCESS_POOL_MAX_PENDING 时立即抛出 ProcessPoolBusy，而不是让请求线程排队等待。
+    PROCESS_POOL_WORKERS 为 0 时直接在当前线程中执行。
+
+    :param timeout: 等待结果的超时时间（秒），默认使用 PROCESS_POOL_TIMEOUT。超时抛出 InternalError
+    """
+    config = get_config()
+    if not config.PROCESS_POOL_WORKERS:
+        return func(*args)
+    if timeout is None:
+        timeout = config.PROCESS_POOL_TIMEOUT
+
+    pool, slots = _get_process_pool()
+    if not slots.acquire(blocking=False):
+        _increment("process_pool.rejected")
+        raise ProcessPoolBusy()
+    try:
+        future = pool.submit(func, *args)
+    except BrokenProcessPool:
+        slots.release()
+        _increment("process_pool.broken")
+        _reset_process_pool(pool)
+        return func(*args)
+    future.add_done_callback(lambda _: slots.release())  # 超时返回后任务仍在执行，执行完才释放名额
+
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        raise InternalError(f"{getattr(func, '__name__', func)} timed out after {timeout}s in process pool")
+    except BrokenProcessPool:
+        # 子进程异常退出后进程池不可用，下次使用时重建进程池，这一次在当前线程中执行
+        _increment("process_pool.broken")
+        _reset_process_pool(pool)
+        return func(*args)
+
+
+def _increment(metric: str) -> None:
+    from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+
+    if statsd:
+        statsd.increment(metric)
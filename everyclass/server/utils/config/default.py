@@ -123,7 +123,9 @@ class Config(object):
     CDN_DOMAIN = 'cdn.domain.com'
     CDN_ENDPOINTS = ['images', 'static']
     CDN_TIMESTAMP = False
-    HTML_MINIFY = True
+    HTML_MINIFY = True  # 加载模板时去掉缩进和空行
+    HTML_MINIFY_VERIFY_RATE = 0.0  # 抽样用 htmlmin 检查压缩效果的请求比例，只上报指标，不修改响应
+    JSON_BACKEND = 'json'  # API 的 JSON 序列化方式：json 为标准库；orjson 更快，输出紧凑且不转义非 ASCII 字符（需要安装 orjson）
     STATIC_VERSIONED = True
     with open(os.path.join(os.path.dirname(__file__), '../../../../frontend/rev-manifest.json'), 'r') as static_manifest:
         STATIC_MANIFEST = json.load(static_manifest)
@@ -185,12 +187,53 @@ class Config(object):
         }
     }
 
+    """
+    缓存
+    """
+    ENTITY_CACHE_LOCAL_SIZE = 1024  # 每个 worker 进程内 LRU 缓存的条目数
+    ENTITY_CACHE_TTL = 60 * 60 * 24  # Redis 中缓存的过期时间（秒）。缓存键带有数据版本，过期时间只用于回收旧数据
+    PEOPLE_NOT_FOUND_TTL = 60 * 5  # 找不到的学号或教工号的缓存时间（秒）
+    SINGLE_FLIGHT_REDIS_LOCK = False  # 缓存未命中时是否通过 Redis 锁在 worker 之间合并相同的上游请求
+    SINGLE_FLIGHT_LOCK_MS = 3000  # Redis 锁的过期时间，也是未拿到锁的 worker 等待结果的最长时间（毫秒）
+    ACCESS_CACHE_LOCAL_SIZE = 4096  # 隐私级别和授权缓存在每个 worker 进程内的条目数
+    ACCESS_CACHE_TTL = 60 * 60 * 24  # 隐私级别和授权缓存在 Redis 中的过期时间（秒），修改时会同步更新
+    ACCESS_CACHE_LOCAL_TTL = 30  # 隐私级别和授权缓存在进程内的过期时间（秒），即修改后其他进程最多使用旧值的时长
+
+    """
+    并发
+    """
+    FAN_OUT_WORKERS = 8  # 每个 worker 进程内用于并发调用上游的线程数
+    FAN_OUT_TIMEOUT = 10  # 一次扇出调用的整体超时时间（秒）
+    FAN_OUT_CALL_TIMEOUT = 5  # 扇出中单个任务从开始执行算起的超时时间（秒），一个上游调用过慢时不必等满整体超时
+    FOOTPRINT_FLUSH_INTERVAL = 5  # 访问轨迹和访客计数批量写入的周期（秒）
+    FOOTPRINT_FLUSH_BATCH = 200  # 缓冲区中的访问记录达到这个数量时立即写入
+    FOOTPRINT_MAX_PENDING = 10000  # 缓冲区上限，写入跟不上时丢弃新的访问记录
+    PROCESS_POOL_WORKERS = 1  # 每个 worker 进程用于密码哈希等 CPU 密集任务的子进程数，为 0 时在请求线程中执行
+    PROCESS_POOL_MAX_PENDING = 8  # 进程池中正在执行和排队的任务上限，超出时直接拒绝请求
+    PROCESS_POOL_TIMEOUT = 10  # 等待进程池中任务结果的超时时间（秒）
+
+    """
+    日历
+    """
+    ICS_SERIALIZER = 'icalendar'  # ics 文件的生成方式：icalendar 使用 icalendar 库，fast 直接输出文本（更快，输出相同）
+    ICS_WORKER_THREADS = 1  # 每个 worker 进程内的后台生成线程数，为 0 时在请求中同步生成
+    ICS_PREGENERATE_DAYS = 7  # 数据更新后，预先生成最近多少天内使用过的令牌对应的文件
+    CALENDAR_TOKEN_FLUSH_INTERVAL = 60  # 令牌最后使用时间批量写入数据库的周期（秒），即进程异常退出时最多丢失的时长
+    CALENDAR_TOKEN_FLUSH_BATCH = 500  # 缓冲区中的令牌数达到这个值时立即写入
+    CALENDAR_TOKEN_CACHE_LOCAL_SIZE = 4096  # 每个 worker 进程内缓存的令牌条目数
+    CALENDAR_TOKEN_CACHE_TTL = 60 * 60 * 24 * 7  # 令牌缓存在 Redis 中的过期时间（秒），重置令牌时写入的删除标记也保留这么久
+    CALENDAR_TOKEN_LOCAL_TTL = 60  # 令牌缓存在进程内的过期时间（秒），即重置令牌后其他进程最多还能使用旧令牌的时长
+    CALENDAR_TOKEN_NEGATIVE_TTL = 60 * 10  # 不存在的令牌在 Redis 中的缓存时间（秒）
+
     ANDROID_CLIENT_URL = ''  # apk file for android client, dynamically fetched when starting
 
     FEATURE_GATING = {
         'course': False,
     }
     DEFAULT_PRIVACY_LEVEL = 0
+    USER_ID_BLOCK_SIZE = 1000  # 每个进程一次从数据库序列中预留的 user id 数量
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:150000'  # werkzeug 密码哈希方法及迭代次数，修改后旧哈希在用户下次登录时自动升级
+    PASSWORD_SALT_LENGTH = 8
 
     RESOURCE_IDENTIFIER_ENCRYPTION_KEY = 'z094gikTit;5gt5h'
     SESSION_CRYPTO_KEY = b'\xcb\xf2\x19H\xd9l\x05\xc7j\xb2\xd0^}B*\x8d\xb6\x8aPd\x1c%\x83\x1e_\xf0\xb9C\xa9XOC'
@@ -220,6 +263,10 @@ uLs7Rr/w61DfD0ppDv8CdIdYKZd3bHvWB1e1OlS+dDs+Xk0vzMGd9LAv50BbcIBA
 o0eyVgAIK02BNOQ8uQIDAQAB
 -----END PUBLIC KEY-----
 """
+    JWT_ALGORITHM = 'RS256'  # 签发 token 使用的算法：RS256，或者供内部客户端使用、验证更快的 HS256（需要设置 JWT_HMAC_SECRET）
+    JWT_HMAC_SECRET = ''  # HS256 的密钥，为空时不接受 HS256 token
+    JWT_CACHE_SIZE = 10000  # 每个进程缓存的已验证 token 数
+    JWT_CACHE_TTL = 60 * 10  # 已验证 token 的缓存时间（秒）
 
     TENCENT_CAPTCHA_AID = ''
     TENCENT_CAPTCHA_SECRET = ''
@@ -249,5 +296,6 @@ o0eyVgAIK02BNOQ8uQIDAQAB
                                 "RESOURCE_IDENTIFIER_ENCRYPTION_KEY",
                                 "ENTITY_TOKEN",
                                 "SESSION_CRYPTO_KEY",
-                                "JWT_PRIVATE_KEY"
+                                "JWT_PRIVATE_KEY",
+                                "JWT_HMAC_SECRET"
                                 )
@@ -1,6 +1,7 @@
+import functools
 import re
 from binascii import a2b_base64, b2a_base64
-from typing import Text
+from typing import List, Sequence, Text, Tuple
 
 from Crypto.Cipher import AES
 
@@ -17,38 +18,93 @@ def _fill_16(text):
     return str.encode(text)
 
 
-def _aes_decrypt(aes_key, aes_text) -> Text:
+class ResourceCodec:
     """
-    使用密钥解密文本信息，将会自动填充空白字符
-    :param aes_key: 解密密钥
-    :param aes_text: 需要解密的文本
-    :return: 经过解密的数据
+    绑定一个密钥的资源标识符编解码器，与 encrypt/decrypt 的结果完全一致
+
+    cipher 只在构造时创建一次（ECB 模式没有跨调用的状态，可以在线程间共享），编解码结果缓存在有界 LRU 中。
     """
-    # 初始化解码器
-    cipher = AES.new(_fill_16(aes_key), AES.MODE_ECB)
-    # 优先逆向解密十六进制为bytes
-    converted = a2b_base64(aes_text.replace('-', '/').replace("%3D", "=").encode())
-    # 使用aes解密密文
-    decrypt_text = str(cipher.decrypt(converted), encoding='utf-8').replace('\0', '')
-    # 返回执行结果
-    return decrypt_text.strip()
 
+    def __init__(self, key: str, cache_size: int = 4096):
+        self._cipher = AES.new(_fill_16(key), AES.MODE_ECB)
+        self._encrypt = functools.lru_cache(maxsize=cache_size)(self._encrypt_uncached)
+        self._decrypt = functools.lru_cache(maxsize=cache_size)(self._decrypt_uncached)
+
+    def encrypt(self, resource_type: str, data: str) -> Text:
+        if resource_type not in (RTYPE_STUDENT, RTYPE_TEACHER, RTYPE_CLASS, RTYPE_ROOM, RTYPE_PEOPLE):
+            raise ValueError("resource_type not valid")
+        return self._encrypt("%s;%s" % (resource_type, data))
+
+    def decrypt(self, data: str, resource_type: str = None) -> Tuple[str, str]:
+        result = self._decrypt(data)
+        if resource_type and result[0] != resource_type:
+            raise ValueError('Resource type not correspond')
+        return result
+
+    def encrypt_many(self, resource_type: str, items: Sequence[str]) -> List[Text]:
+        """批量加密，所有明文拼接成一段连续的缓冲区，只调用一次 AES"""
+        if resource_type not in (RTYPE_STUDENT, RTYPE_TEACHER, RTYPE_CLASS, RTYPE_ROOM, RTYPE_PEOPLE):
+            raise ValueError("resource_type not valid")
+        blocks = [_fill_16("%s;%s" % (resource_type, data)) for data in items]
+        encrypted = self._cipher.encrypt(b"".join(blocks))
+
+        results = []
+        offset = 0
+        for block in blocks:
+            results.append(_encode_ciphertext(encrypted[offset:offset + len(block)]))
+            offset += len(block)
+        return results
+
+    def decrypt_many(self, items: Sequence[str], resource_type: str = None) -> List[Tuple[str, str]]:
+        """批量解密，所有密文拼接成一段连续的缓冲区，只调用一次 AES。任一密文无效时抛出 ValueError"""
+        blocks = [_decode_ciphertext(data) for data in items]
+        if any(len(block) % 16 for block in blocks):
+            raise ValueError("Data must be padded to 16 byte boundary in ECB mode")
+        decrypted = self._cipher.decrypt(b"".join(blocks))
+
+        results = []
+        offset = 0
+        for block in blocks:
+            result = _parse_plaintext(_strip_plaintext(decrypted[offset:offset + len(block)]))
+            if resource_type and result[0] != resource_type:
+                raise ValueError('Resource type not correspond')
+            results.append(result)
+            offset += len(block)
+        return results
+
+    def _encrypt_uncached(self, text: str) -> Text:
+        return _encode_ciphertext(self._cipher.encrypt(_fill_16(text)))
+
+    def _decrypt_uncached(self, data: str) -> Tuple[str, str]:
+        return _parse_plaintext(_strip_plaintext(self._cipher.decrypt(_decode_ciphertext(data))))
+
+
+def _encode_ciphertext(ciphertext: bytes) -> Text:
+    return b2a_base64(ciphertext).decode().replace('/', '-').strip()
 
-def _aes_encrypt(aes_key, aes_text) -> Text:
-    """
-    使用密钥加密文本信息，将会自动填充空白字符
-    :param aes_key: 加密密钥
-    :param aes_text: 需要加密的文本
-    :return: 经过加密的数据
-    """
-    # 初始化加密器
-    cipher = AES.new(_fill_16(aes_key), AES.MODE_ECB)
-    # 先进行aes加密
-    aes_encrypted = cipher.encrypt(_fill_16(aes_text))
-    # 使用十六进制转成字符串形式
-    encrypt_text = b2a_base64(aes_encrypted).decode().replace('/', '-').strip()
-    # 返回执行结果
-    return encrypt_text
+
+def _decode_ciphertext(data: str) -> bytes:
+    return a2b_base64(data.replace('-', '/').replace("%3D", "=").encode())
+
+
+def _strip_plaintext(plaintext: bytes) -> Text:
+    return str(plaintext, encoding='utf-8').replace('\0', '').strip()
+
+
+_DECRYPTED_PATTERN = re.compile(r'^(student|teacher|klass|room);([\s\S]+)$')
+
+
+def _parse_plaintext(text: str) -> Tuple[str, str]:
+    group = _DECRYPTED_PATTERN.match(text)  # 通过正则校验确定数据的正确性
+    if group is None:
+        raise ValueError('Decrypted data is invalid: %s' % text)
+    return group.group(1), group.group(2)
+
+
+@functools.lru_cache(maxsize=8)
+def get_codec(encryption_key: str = None) -> ResourceCodec:
+    """获得某个密钥的编解码器，不指定时使用配置中的密钥"""
+    return ResourceCodec(encryption_key or get_config().RESOURCE_IDENTIFIER_ENCRYPTION_KEY)
 
 
 def encrypt(resource_type: str, data: str, encryption_key: str = None) -> Text:
@@ -60,12 +116,12 @@ def encrypt(resource_type: str, data: str, encryption_key: str = None) -> Text:
     :param encryption_key: 加密使用的 key
     :return: 加密后的资源标识符
     """
-    if resource_type not in (RTYPE_STUDENT, RTYPE_TEACHER, RTYPE_CLASS, RTYPE_ROOM, RTYPE_PEOPLE):
-        raise ValueError("resource_type not valid")
-    if not encryption_key:
-        encryption_key = get_config().RESOURCE_IDENTIFIER_ENCRYPTION_KEY
+    return get_codec(encryption_key).encrypt(resource_type, data)
 
-    return _aes_encrypt(encryption_key, "%s;%s" % (resource_type, data))
+
+def encrypt_many(resource_type: str, items: Sequence[str], encryption_key: str = None) -> List[Text]:
+    """批量加密同一类型的资源标识符，结果与逐个调用 encrypt 相同"""
+    return get_codec(encryption_key).encrypt_many(resource_type, items)
 
 
 RTYPE_STUDENT = 'student'
@@ -85,15 +141,9 @@ def decrypt(data: str, encryption_key: str = None, resource_type: str = None):
     :param resource_type: 验证资源类型（student、teacher、klass、room）
     :return: 资源类型和资源ID
     """
-    if not encryption_key:
-        encryption_key = get_config().RESOURCE_IDENTIFIER_ENCRYPTION_KEY
+    return get_codec(encryption_key).decrypt(data, resource_type)
 
-    data = _aes_decrypt(encryption_key, data)
 
-    group = re.match(r'^(student|teacher|klass|room);([\s\S]+)$', data)  # 通过正则校验确定数据的正确性
-    if group is None:
-        raise ValueError('Decrypted data is invalid: %s' % data)
-    else:
-        if resource_type and group.group(1) != resource_type:
-            raise ValueError('Resource type not correspond')
-        return group.group(1), group.group(2)
+def decrypt_many(items: Sequence[str], encryption_key: str = None, resource_type: str = None) -> List[Tuple[str, str]]:
+    """批量解密资源标识符，结果与逐个调用 decrypt 相同"""
+    return get_codec(encryption_key).decrypt_many(items, resource_type)
@@ -1,10 +1,18 @@
 import abc
+import gzip
+import hashlib
 import json
-from typing import Dict
+from typing import Any, Callable, Dict, NamedTuple, Optional
 
-from flask import Response
+from flask import Response, request
 
 from everyclass.common.env import is_production
+from everyclass.server.utils.config import get_config
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖，只有 JSON_BACKEND = 'orjson' 时才需要安装
+    orjson = None
 
 
 class JSONSerializable:
@@ -27,19 +35,96 @@ class AdvancedJSONEncoder(json.JSONEncoder):
     """
 
     def default(self, obj):
-        if isinstance(obj, JSONSerializable):
-            return obj.__json_encode__()
-        return json.JSONEncoder.default(self, obj)
+        return _default(obj)
+
+
+def _default(obj):
+    cls = type(obj)
+    encoder = _encoders[cls] if cls in _encoders else _encoder_for(cls)
+    if encoder is None:
+        raise TypeError(f'Object of type {cls.__name__} is not JSON serializable')
+    return encoder(obj)
+
+
+_encoders: Dict[type, Optional[Callable[[Any], Any]]] = {}
+_stdlib_encoder = AdvancedJSONEncoder()  # encode() 不修改 encoder 的状态，可以在线程间共享
+
+
+def _encoder_for(cls: type) -> Optional[Callable[[Any], Any]]:
+    """按类缓存对象的转换函数，避免每个对象都做一次 isinstance 判断和方法查找。不是 JSONSerializable 的类返回 None"""
+    try:
+        return _encoders[cls]
+    except KeyError:
+        encoder = cls.__json_encode__ if issubclass(cls, JSONSerializable) else None
+        _encoders[cls] = encoder
+        return encoder
+
+
+def _orjson_default(obj):
+    if isinstance(obj, tuple):  # orjson 不直接序列化 namedtuple，按标准库的行为输出为数组
+        return list(obj)
+    return _default(obj)
 
 
 def to_json(obj) -> str:
-    return json.dumps(obj, cls=AdvancedJSONEncoder)
+    """使用标准库序列化，输出与 json.dumps(obj, cls=AdvancedJSONEncoder) 逐字节相同"""
+    return _stdlib_encoder.encode(obj)
+
+
+def to_json_bytes(obj) -> bytes:
+    """
+    按 JSON_BACKEND 配置序列化为 UTF-8 字节串
+
+    orjson 的输出与标准库语义相同，但为紧凑格式且不转义非 ASCII 字符。dataclass 和 datetime 交给 default 处理，
+    保证 JSONSerializable 子类仍然使用 __json_encode__ 的结果。
+    """
+    if orjson is not None and get_config().JSON_BACKEND == 'orjson':
+        return orjson.dumps(obj, default=_orjson_default,
+                            option=orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+    return to_json(obj).encode('utf-8')
 
 
 def to_json_response(obj) -> Response:
-    resp = Response(to_json(obj), mimetype='application/json')
+    resp = Response(to_json_bytes(obj), mimetype='application/json')
+    _add_cors_headers(resp)
+    return resp
+
+
+class PrecomputedJSON(NamedTuple):
+    """预先序列化好的 JSON 响应体，用于在数据版本内不变的大对象"""
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+
+def precompute_json(obj) -> PrecomputedJSON:
+    body = to_json_bytes(obj)
+    return PrecomputedJSON(body=body, gzipped=gzip.compress(body), etag=hashlib.sha1(body).hexdigest())
+
+
+def to_precomputed_json_response(payload: PrecomputedJSON) -> Response:
+    """
+    返回预先序列化的 JSON，支持 If-None-Match，客户端接受 gzip 时直接返回预先压缩好的内容
+
+    压缩和未压缩的响应体是不同的字节序列，使用不同的强校验值（压缩的加上 -gzip 后缀）。If-None-Match 中出现任意一种都视为未修改。
+    """
+    gzipped = request.accept_encodings['gzip'] > 0  # 不能用 in 判断，werkzeug 会保留 gzip;q=0 这样的条目
+    etag = payload.etag + '-gzip' if gzipped else payload.etag
+    if request.if_none_match.contains(payload.etag) or request.if_none_match.contains(payload.etag + '-gzip'):
+        resp = Response(status=304)
+    elif gzipped:
+        resp = Response(payload.gzipped, mimetype='application/json')
+        resp.headers['Content-Encoding'] = 'gzip'
+    else:
+        resp = Response(payload.body, mimetype='application/json')
+    resp.set_etag(etag)
+    resp.vary.add('Accept-Encoding')
+    _add_cors_headers(resp)
+    return resp
+
+
+def _add_cors_headers(resp: Response) -> None:
     resp.headers.add_header('Access-Control-Allow-Origin',
                             'https://everyclass.xyz' if is_production() else 'https://staging.everyclass.xyz')
     resp.headers.add_header('Access-Control-Allow-Credentials', 'true')
     # resp.headers.add_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
-    return resp
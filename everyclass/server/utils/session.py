@@ -1,25 +1,73 @@
-import _pickle
 import base64
+import functools
+import io
 import pickle
+import threading
+import time
 import zlib
-from typing import NamedTuple
+from typing import Callable, List, NamedTuple, Optional, Tuple
 
 from Crypto.Cipher import AES
+from flask.json.tag import JSONTag, TaggedJSONSerializer
 from flask.sessions import SessionInterface, SessionMixin
 from werkzeug.datastructures import CallbackDict
 
 
 # https://github.com/SaintFlipper/EncryptedSession/blob/master/main.py
 class EncryptedSession(CallbackDict, SessionMixin):
-    def __init__(self, initial=None):
+    """
+    延迟解密的 session：构造时只保存解密函数，第一次读写时才解密 cookie。未被访问的 session 不会被解密，也不会被重新加密保存
+    """
+
+    def __init__(self, initial=None, loader: Optional[Callable[[], Tuple[dict, bool]]] = None,
+                 issued_at: Optional[int] = None):
         def on_update(self):
             self.modified = True
 
         CallbackDict.__init__(self, initial, on_update)
         self.modified = False
+        self.issued_at = issued_at  # cookie 签发时间戳，旧格式 cookie 为 None
+        self._loader = loader
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loader is None
+
+    def _load(self) -> None:
+        if self._loader is None:
+            return
+        with self._lock:  # session 会通过 copy_current_request_context 被其他线程同时访问
+            if self._loader is not None:
+                data, outdated = self._loader()
+                dict.update(self, data)  # 不触发 on_update
+                if outdated:
+                    self.modified = True  # 旧格式的 cookie，保存时转换为新格式
+                self._loader = None  # 数据写入之后才标记为已加载，其他线程不会读到空的 session
+
+
+def _loading(name: str):
+    method = getattr(CallbackDict, name)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._load()
+        return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+for _name in ('__getitem__', '__setitem__', '__delitem__', '__contains__', '__iter__', '__len__', '__repr__', '__eq__',
+              '__ne__', 'get', 'keys', 'values', 'items', 'copy', 'pop', 'popitem', 'setdefault', 'update', 'clear'):
+    setattr(EncryptedSession, _name, _loading(_name))
 
 
 class EncryptedSessionInterface(SessionInterface):
+    """
+    cookie 格式为 <j|k>.<签发时间戳>.<base64 密文>.<base64 mac>.<base64 nonce>，k 表示压缩过的数据。明文为 tagged JSON，
+    签发时间作为附加数据参与认证。旧格式 <u|z>.<base64 密文>.<base64 mac>.<base64 nonce> 的明文为 pickle，只使用受限的
+    unpickler 读取，读取后会以新格式重新保存。
+    """
     session_class = EncryptedSession
     compress_threshold = 1024
     session_cookie_name = "e_session"  # use special cookie name to avoid historical compatibility issues
@@ -40,39 +88,12 @@ class EncryptedSessionInterface(SessionInterface):
         # Get the crypto key
         crypto_key = app.config['SESSION_CRYPTO_KEY'] if 'SESSION_CRYPTO_KEY' in app.config else app.crypto_key
 
-        # Split the session cookie : <z|u>.<base64 cipher text>.<base64 mac>.<base64 nonce>
         itup = session_cookie.split(".")
-        if len(itup) != 4:
-            return self.session_class()  # Session cookie not in the right format
-
-        try:
-
-            # Compressed data?
-            if itup[0] == 'z':  # session cookie for compressed data starts with "z."
-                is_compressed = True
-            else:
-                is_compressed = False
-
-            # Decode the cookie parts from base64
-            ciphertext = base64.b64decode(bytes(itup[1], 'utf-8'))
-            mac = base64.b64decode(bytes(itup[2], 'utf-8'))
-            nonce = base64.b64decode(bytes(itup[3], 'utf-8'))
-
-            # Decrypt
-            cipher = AES.new(crypto_key, AES.MODE_EAX, nonce)
-            data = cipher.decrypt_and_verify(ciphertext, mac)
-
-            # Convert back to a dict and pass that onto the session
-            if is_compressed:
-                data = zlib.decompress(data)
-            session_dict = pickle.loads(data)
-
-            return self.session_class(session_dict)
-
-        except (ValueError, _pickle.UnpicklingError, pickle.UnpicklingError, AttributeError, ModuleNotFoundError):
-            # AttributeError and ModuleNotFoundError is due to migration of classes
-            # it's acceptable to clean the user's whole session if there is error when unpickling, biz coders have to know this rule.
-            return self.session_class()
+        if len(itup) == 5 and itup[0] in ('j', 'k') and itup[1].isdigit():
+            return self.session_class(loader=functools.partial(_decode, crypto_key, itup), issued_at=int(itup[1]))
+        if len(itup) == 4:
+            return self.session_class(loader=functools.partial(_decode_legacy, crypto_key, itup))
+        return self.session_class()  # Session cookie not in the right format
 
     def save_session(self, app, session, response):
         """
@@ -82,37 +103,37 @@ class EncryptedSessionInterface(SessionInterface):
         @summary: Saves the current session. This overrides the default Flask implementation, adding
         AES encryption of the client-side session cookie.
         """
+        if not session.loaded:
+            return  # 本次请求没有访问 session，cookie 不需要变化
 
         domain = self.get_cookie_domain(app)
         if not session:
             if session.modified:
                 response.delete_cookie(app.session_cookie_name, domain=domain)
             return
+        if not session.modified and not self._near_expiry(app, session):
+            return
         expires = self.get_expiration_time(app, session)
 
         # Decide whether to compress
-        bdict = pickle.dumps(dict(session))
-        if len(bdict) > self.compress_threshold:
-            prefix = "z"  # session cookie for compressed data starts with "z."
-            bdict = zlib.compress(bdict)
+        data = _serializer.dumps(dict(session)).encode('utf-8')
+        if len(data) > self.compress_threshold:
+            prefix = "k"
+            data = zlib.compress(data)
         else:
-            prefix = "u"  # session cookie for uncompressed data starts with "u."
+            prefix = "j"
+        header = f"{prefix}.{int(time.time())}"
 
         # Get the crypto key
         crypto_key = app.config['SESSION_CRYPTO_KEY'] if 'SESSION_CRYPTO_KEY' in app.config else app.crypto_key
 
         # Encrypt using AES in EAX mode
         cipher = AES.new(crypto_key, AES.MODE_EAX)
-        ciphertext, mac = cipher.encrypt_and_digest(bdict)
-        nonce = cipher.nonce
+        cipher.update(header.encode())
+        ciphertext, mac = cipher.encrypt_and_digest(data)
 
-        # Convert the ciphertext, mac, and nonce to base64
-        b64_ciphertext = base64.b64encode(ciphertext)
-        b64_mac = base64.b64encode(mac)
-        b64_nonce = base64.b64encode(nonce)
-
-        # Create the session cookie as <u|z>.<base64 cipher text>.<base64 mac>.<base64 nonce>
-        tup = [prefix, b64_ciphertext.decode(), b64_mac.decode(), b64_nonce.decode()]
+        tup = [header, base64.b64encode(ciphertext).decode(), base64.b64encode(mac).decode(),
+               base64.b64encode(cipher.nonce).decode()]
         session_cookie = ".".join(tup)
 
         # Set the session cookie
@@ -120,6 +141,57 @@ class EncryptedSessionInterface(SessionInterface):
                             expires=expires, httponly=True,
                             domain=domain)
 
+    @staticmethod
+    def _near_expiry(app, session) -> bool:
+        """持久 session 已经过了一半有效期时，需要刷新 cookie 的过期时间。浏览器会话 cookie 不需要刷新"""
+        if not session.permanent or session.issued_at is None:
+            return False
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        return time.time() - session.issued_at > lifetime / 2
+
+
+def _decode(crypto_key: bytes, itup: List[str]) -> Tuple[dict, bool]:
+    """解密新格式的 cookie，失败时返回空字典"""
+    try:
+        ciphertext, mac, nonce = (base64.b64decode(bytes(part, 'utf-8')) for part in itup[2:])
+        cipher = AES.new(crypto_key, AES.MODE_EAX, nonce)
+        cipher.update(f"{itup[0]}.{itup[1]}".encode())
+        data = cipher.decrypt_and_verify(ciphertext, mac)
+        if itup[0] == 'k':
+            data = zlib.decompress(data)
+        return _serializer.loads(data.decode('utf-8')), False
+    except (ValueError, TypeError, KeyError, zlib.error):
+        # 结构变化导致无法还原时清空用户的 session，与 pickle 时期的规则相同
+        return {}, False
+
+
+def _decode_legacy(crypto_key: bytes, itup: List[str]) -> Tuple[dict, bool]:
+    """解密旧格式（pickle）的 cookie，失败时返回空字典"""
+    try:
+        ciphertext, mac, nonce = (base64.b64decode(bytes(part, 'utf-8')) for part in itup[1:])
+        cipher = AES.new(crypto_key, AES.MODE_EAX, nonce)
+        data = cipher.decrypt_and_verify(ciphertext, mac)
+        if itup[0] == 'z':  # session cookie for compressed data starts with "z."
+            data = zlib.decompress(data)
+        return _RestrictedUnpickler(io.BytesIO(data)).load(), True
+    except (ValueError, pickle.UnpicklingError, AttributeError, ModuleNotFoundError, zlib.error):
+        # AttributeError and ModuleNotFoundError is due to migration of classes
+        # it's acceptable to clean the user's whole session if there is error when unpickling, biz coders have to know this rule.
+        return {}, False
+
+
+class _RestrictedUnpickler(pickle.Unpickler):
+    """只允许还原 session 中会出现的类型，避免反序列化执行任意代码"""
+    allowed = {('everyclass.server.utils.session', 'StudentSession'),
+               ('everyclass.server.utils.session', 'UserSession'),
+               ('uuid', 'UUID'),
+               ('uuid', 'SafeUUID')}
+
+    def find_class(self, module, name):
+        if (module, name) not in self.allowed:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in session")
+        return super().find_class(module, name)
+
 
 class StudentSession(NamedTuple):
     """
@@ -144,3 +216,34 @@ class UserSession(NamedTuple):
     identifier: str
     identifier_encoded: str  # 编码后的学号或教工号
     name: str
+
+
+class _TagNamedTuple(JSONTag):
+    """session 中的 NamedTuple 类型。需要先于 flask 内置的 tuple 标签匹配，否则会被还原成普通的 tuple"""
+    cls: type = tuple
+
+    def check(self, value):
+        return type(value) is self.cls
+
+    def to_json(self, value):
+        return [self.serializer.tag(item) for item in value]
+
+    def to_python(self, value):
+        return self.cls(*value)
+
+
+class _TagStudentSession(_TagNamedTuple):
+    __slots__ = ()
+    key = ' ss'
+    cls = StudentSession
+
+
+class _TagUserSession(_TagNamedTuple):
+    __slots__ = ()
+    key = ' us'
+    cls = UserSession
+
+
+_serializer = TaggedJSONSerializer()
+_serializer.register(_TagStudentSession, index=0)
+_serializer.register(_TagUserSession, index=0)
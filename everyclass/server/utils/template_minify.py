@@ -0,0 +1,65 @@
+"""
+模板加载时压缩 HTML
+
+原先在 after_request 中用 htmlmin 压缩每一个 HTML 响应，这是每次请求都要付出的纯 Python CPU 开销，且与页面大小成正比。
+现在改为在 Jinja 加载模板时（每个进程每个模板只做一次）去掉每行的缩进和空行，渲染时不再有额外开销。
+
+为了不改变页面的显示效果，这里只做安全的压缩：行内空白和换行都会保留，<pre> 和 <textarea> 中的内容原样保留。
+注意 JavaScript 中跨行的模板字符串也会被去掉缩进，模板中不要依赖这种写法。
+"""
+import random
+import re
+
+from jinja2.ext import Extension
+
+_PRESERVE_OPEN = re.compile(r'<(pre|textarea)\b', re.IGNORECASE)
+_PRESERVE_CLOSE = re.compile(r'</(pre|textarea)\s*>', re.IGNORECASE)
+
+
+def strip_whitespace(source: str) -> str:
+    """
+    去掉每行开头的空白和空行，<pre> 和 <textarea> 中的行除外
+
+    >>> strip_whitespace("<div>\\n    <p>a</p>\\n\\n</div>")
+    '<div>\\n<p>a</p>\\n</div>'
+    """
+    lines = []
+    preserving = False
+    for line in source.splitlines():
+        if preserving:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped:
+                lines.append(stripped)
+
+        # 按一行中最后出现的开始/结束标签判断下一行是否需要原样保留
+        last_open = max((m.start() for m in _PRESERVE_OPEN.finditer(line)), default=-1)
+        last_close = max((m.start() for m in _PRESERVE_CLOSE.finditer(line)), default=-1)
+        if last_open > last_close:
+            preserving = True
+        elif last_close > last_open:
+            preserving = False
+    return "\n".join(lines)
+
+
+class WhitespaceStripExtension(Extension):
+    """Jinja 扩展，在模板编译前调用 strip_whitespace。模板编译结果会被 Jinja 缓存，因此每个模板只处理一次"""
+
+    def preprocess(self, source, name, filename=None):
+        return strip_whitespace(source)
+
+
+def verify_sampled(body: str, rate: float) -> None:
+    """
+    按 rate 的比例抽样，用 htmlmin 再压缩一遍响应，把还能节省的字节数上报到 statsd，用于观察加载时压缩的效果。
+    只做统计，不修改响应。
+    """
+    if rate <= 0 or random.random() >= rate:
+        return
+
+    from htmlmin import minify
+    from everyclass.server import statsd  # 需要在这里导入，否则导入的结果是None
+
+    if statsd:
+        statsd.histogram("html_minify.residual_bytes", len(body.encode()) - len(minify(body).encode()))
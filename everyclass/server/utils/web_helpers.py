@@ -9,6 +9,7 @@ from everyclass.rpc.entity import StudentTimetableResult
 from everyclass.server import sentry, logger
 from everyclass.server.user import service as user_service
 from everyclass.server.user.exceptions import AlreadyRegisteredError, InvalidTokenError
+from everyclass.server.utils.concurrency import ProcessPoolBusy
 from everyclass.server.utils.config import get_config
 from everyclass.server.utils.web_consts import MSG_400, SESSION_CURRENT_USER, MSG_NOT_LOGGED_IN
 
@@ -73,12 +74,14 @@ def handle_exception_with_error_page(e: Exception) -> Text:
     """处理抛出的异常，返回错误页。
     """
     from everyclass.server.utils.web_consts import MSG_TIMEOUT, MSG_404, MSG_400, MSG_INTERNAL_ERROR, MSG_503, MSG_ALREADY_REGISTERED, \
-        MSG_TOKEN_INVALID
+        MSG_TOKEN_INVALID, MSG_SERVER_BUSY
 
     if isinstance(e, AlreadyRegisteredError):
         return _error_page(MSG_ALREADY_REGISTERED)
     if isinstance(e, InvalidTokenError):
         return _error_page(MSG_TOKEN_INVALID)
+    if isinstance(e, ProcessPoolBusy):
+        return _error_page(MSG_SERVER_BUSY)
 
     if isinstance(e, RpcTimeout):
         return _error_page(MSG_TIMEOUT, sentry_capture=True)
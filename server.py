@@ -1,5 +1,6 @@
 import os
 
+import click
 import gc
 from ddtrace import patch_all, tracer
 
@@ -27,5 +28,14 @@ def test():
     unittest.TextTestRunner(verbosity=2).run(tests)
 
 
+@app.cli.command()
+@click.option('--incremental', is_flag=True, help="Only recompute classes reviewed since the last sync.")
+def sync_class_reviews(incremental):
+    """Aggregate class reviews into klass_meta."""
+    from everyclass.server.course.model import KlassReview
+    result = KlassReview.sync_to_class_meta(incremental)
+    print(f"{result['mode']} sync: {result['updated']} classes updated, {result['reset']} reset, {result['elapsed_ms']} ms")
+
+
 if __name__ == '__main__':
     print("You should not run this file. Instead, run `uwsgi --ini deploy/uwsgi-local.ini` for consistent behaviour.")
@@ -1,6 +1,6 @@
 import unittest
 
-from flask import current_app
+from flask import current_app, request
 
 from everyclass.server import create_app
 
@@ -20,6 +20,44 @@ class TestCase1(unittest.TestCase):
     def test_app_exists(self):
         self.assertFalse(current_app is None)
 
+    def test_static_request_skips_session(self):
+        """静态文件和健康检查请求不解密 session cookie"""
+        from flask import session
+
+        for path in ('/_healthCheck', '/robots.txt'):
+            with self.app.test_request_context(path, headers={'Cookie': 'e_session=j.0.AAAA.AAAA.AAAA'}):
+                self.app.preprocess_request()
+                self.assertTrue(request.endpoint in ('main.health_check', 'static'))
+                self.assertTrue(not session.loaded)
+
+    def test_ics_conditional_request(self):
+        """ETag 不匹配时即使 If-Modified-Since 未过期也返回完整文件（If-None-Match 优先）"""
+        import os
+        import tempfile
+        import time
+        from unittest import mock
+        from werkzeug.http import http_date
+        from everyclass.server.calendar.repo.ics_file import IcsFileMeta
+
+        calendar_token = '12345678-1234-5678-1234-567812345678'
+        token = {'type': 'student', 'identifier': '3901160407', 'semester': '2019-2020-1'}
+        meta = IcsFileMeta(digest='new', version='v', last_modified=time.time() - 3600)
+        fresh = http_date(time.time())
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'a.ics'), 'wb') as f:
+                f.write(b'BEGIN:VCALENDAR\r\nEND:VCALENDAR\r\n')
+            with mock.patch('everyclass.server.calendar.views.calendar_dir', return_value=directory), \
+                    mock.patch('everyclass.server.calendar.service.find_calendar_token', return_value=token), \
+                    mock.patch('everyclass.server.calendar.service.use_calendar_token'), \
+                    mock.patch('everyclass.server.calendar.service.get_ics_file', return_value=('a.ics', meta)):
+                for headers, status_code in (({'If-None-Match': '"old"', 'If-Modified-Since': fresh}, 200),
+                                             ({'If-None-Match': '"new"'}, 304),
+                                             ({'If-Modified-Since': fresh}, 304)):
+                    with self.app.test_request_context(f'/calendar/ics/{calendar_token}.ics', headers=headers):
+                        response = self.app.view_functions['calendar.ics_download'](calendar_token)
+                        self.assertTrue(response.status_code == status_code)
+
 
 class BasicFunctionTestCase(unittest.TestCase):
     """basic function in everyclass/__init__.py"""
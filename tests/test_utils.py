@@ -70,3 +70,334 @@ class ResourceIdentifierEncryptTest(unittest.TestCase):
         from everyclass.server.utils.encryption import decrypt
         for tp, data, encrypted in self.cases:
             self.assertTrue(decrypt(encrypted, encryption_key=self.key, resource_type=tp) == (tp, data))
+
+    def test_batch(self):
+        from everyclass.server.utils.encryption import decrypt_many, encrypt, encrypt_many
+        ids = ["3901160407", "教室A101", "x" * 40]
+        encrypted = encrypt_many("room", ids, encryption_key=self.key)
+        self.assertTrue(encrypted == [encrypt("room", i, encryption_key=self.key) for i in ids])
+        self.assertTrue(decrypt_many(encrypted, encryption_key=self.key) == [("room", i) for i in ids])
+
+
+class LRUCacheTest(unittest.TestCase):
+    """everyclass/server/utils/cache.py"""
+
+    def test_eviction(self):
+        from everyclass.server.utils.cache import LRUCache, MISSING
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertTrue(cache.get("a") == 1)  # "a" 变为最近使用
+        cache.set("c", 3)
+        self.assertTrue(cache.get("b") is MISSING)
+        self.assertTrue(cache.get("a") == 1)
+        self.assertTrue(cache.get("c") == 3)
+
+    def test_cache_none(self):
+        from everyclass.server.utils.cache import LRUCache, MISSING
+        cache = LRUCache(maxsize=2)
+        cache.set("a", None)
+        self.assertTrue(cache.get("a") is None)
+        self.assertTrue(cache.get("b") is MISSING)
+
+    def test_entry_ttl(self):
+        import time
+        from everyclass.server.utils.cache import LRUCache, MISSING
+        cache = LRUCache(maxsize=2)
+        cache.set("a", None, ttl=0.05)
+        cache.set("b", 1)
+        time.sleep(0.1)
+        self.assertTrue(cache.get("a") is MISSING)
+        self.assertTrue(cache.get("b") == 1)
+
+
+class SingleFlightTest(unittest.TestCase):
+    """everyclass/server/utils/cache.py"""
+
+    def test_concurrent_calls_coalesced(self):
+        import threading
+        import time
+        from everyclass.server.utils.cache import SingleFlight
+
+        flight = SingleFlight()
+        calls = []
+
+        def upstream():
+            calls.append(1)
+            time.sleep(0.2)
+            return "result"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("key", upstream))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertTrue(len(calls) == 1)
+        self.assertTrue(results == ["result"] * 5)
+
+
+class FanOutTest(unittest.TestCase):
+    """everyclass/server/utils/concurrency.py"""
+
+    def test_order(self):
+        import time
+        from everyclass.server.utils.concurrency import fan_out
+
+        def work(i):
+            time.sleep(0.05 * (5 - i))
+            return i
+
+        self.assertTrue(fan_out(work, [(i,) for i in range(5)], span_name="test") == [0, 1, 2, 3, 4])
+
+    def test_call_timeout(self):
+        import time
+        from everyclass.server.utils.base_exceptions import InternalError
+        from everyclass.server.utils.concurrency import fan_out
+
+        def work(i):
+            time.sleep(2 if i == 1 else 0.01)
+            return i
+
+        start = time.monotonic()
+        with self.assertRaises(InternalError) as cm:
+            fan_out(work, [(i,) for i in range(3)], span_name="test", timeout=10, call_timeout=0.2)
+        self.assertTrue(time.monotonic() - start < 1)  # 只等待慢任务的 call_timeout，不等满整体超时
+        self.assertTrue("test(1,)" in cm.exception.status_message)
+
+
+class TopKTest(unittest.TestCase):
+    """everyclass/server/course/model/suggest.py"""
+
+    def test_ties_keep_order(self):
+        import numpy as np
+        from everyclass.server.course.model.suggest import top_k
+
+        scores = np.array([1, 5, 3, 5, 3, 3, 5, 3, -np.inf, 3], dtype=np.float64)
+        expected = sorted(range(len(scores)), key=lambda i: -scores[i])  # 稳定排序，分数相同时保持原顺序
+        for k in range(len(scores) + 2):
+            self.assertTrue(top_k(scores, k).tolist() == expected[:k])
+
+
+class SemesterCalendarTest(unittest.TestCase):
+    """everyclass/server/entity/domain.py"""
+    semesters = {(2018, 2019, 2): {'start': (2019, 2, 24),
+                                   'adjustments': {(2019, 5, 1): {'to': None},
+                                                   (2019, 5, 2): {'to': (2019, 4, 28)}}},
+                 (2019, 2020, 1): {'start': (2019, 8, 25)}}
+
+    def test_semester_date(self):
+        import datetime
+        from everyclass.server.entity.domain import SemesterCalendar
+        calendar = SemesterCalendar(self.semesters)
+        self.assertTrue(calendar.semester_date(datetime.date(2019, 2, 24)) == ('2018-2019-2', 1, 0))
+        self.assertTrue(calendar.semester_date(datetime.date(2019, 8, 24)) == ('2018-2019-2', 26, 6))
+        self.assertTrue(calendar.semester_date(datetime.date(2019, 8, 27)) == ('2019-2020-1', 1, 2))
+        with self.assertRaises(ValueError):
+            calendar.semester_date(datetime.date(2019, 1, 1))
+
+    def test_lesson_date(self):
+        import datetime
+        from everyclass.server.entity.domain import SemesterCalendar
+        calendar = SemesterCalendar(self.semesters)
+        self.assertTrue(calendar.lesson_date((2018, 2019, 2), 1, 1) == datetime.date(2019, 2, 25))
+        self.assertTrue(calendar.lesson_date((2018, 2019, 2), 10, 3) is None)  # 2019-5-1 放假
+        self.assertTrue(calendar.lesson_date((2018, 2019, 2), 10, 4) == datetime.date(2019, 4, 28))  # 2019-5-2 调课
+
+
+class IcsWriterTest(unittest.TestCase):
+    """everyclass/server/calendar/domain/ics_writer.py"""
+
+    def test_escape_and_fold(self):
+        from everyclass.server.calendar.domain.ics_writer import escape_text, fold_line
+        self.assertTrue(escape_text('a,b;c\\d\n教师') == 'a\\,b\\;c\\\\d\\n教师')
+
+        folded = fold_line("SUMMARY:" + "课" * 30)
+        lines = folded.split("\r\n")
+        self.assertTrue(all(len(line.encode('utf-8')) <= 75 for line in lines))
+        self.assertTrue(lines[1].startswith(" "))
+        self.assertTrue("".join(line[1:] if i else line for i, line in enumerate(lines)) == "SUMMARY:" + "课" * 30)
+
+
+class BufferedWriterTest(unittest.TestCase):
+    """everyclass/server/utils/batching.py"""
+
+    def test_coalesce_and_drop(self):
+        from everyclass.server.utils.batching import BufferedWriter
+        batches = []
+        writer = BufferedWriter("test", batches.append, interval=3600, max_batch=100, max_pending=2)
+        self.assertTrue(writer.put("a", 1))
+        self.assertTrue(writer.put("a", 2))
+        self.assertTrue(writer.put("b", 1))
+        self.assertTrue(writer.put("c", 1) is False)
+        writer.flush()
+        self.assertTrue(batches == [{"a": 2, "b": 1}])
+
+
+class TemplateMinifyTest(unittest.TestCase):
+    """everyclass/server/utils/template_minify.py"""
+
+    def test_strip_whitespace(self):
+        from everyclass.server.utils.template_minify import strip_whitespace
+        source = "<div>\n    <b>a</b> b\n\n    <pre>\n  x\n\n  y</pre>\n    <p>c</p>\n</div>\n"
+        self.assertTrue(strip_whitespace(source) == "<div>\n<b>a</b> b\n<pre>\n  x\n\n  y</pre>\n<p>c</p>\n</div>")
+
+
+class PasswordHashTest(unittest.TestCase):
+    """everyclass/server/user/domain.py"""
+
+    def test_needs_rehash(self):
+        from werkzeug.security import generate_password_hash
+        from everyclass.server.user.domain import needs_rehash
+        from everyclass.server.utils.config import get_config
+        config = get_config()
+
+        self.assertTrue(needs_rehash(generate_password_hash("password", "pbkdf2:sha256:50000")))
+        self.assertTrue(not needs_rehash(generate_password_hash("password", config.PASSWORD_HASH_METHOD, config.PASSWORD_SALT_LENGTH)))
+
+
+class EncryptedSessionTest(unittest.TestCase):
+    """everyclass/server/utils/session.py"""
+    crypto_key = b'0123456789abcdef'
+
+    def _app(self, compress_threshold: int = 1024):
+        from flask import Flask, flash, get_flashed_messages, jsonify, session
+        from everyclass.server.utils.session import EncryptedSessionInterface
+
+        app = Flask(__name__)
+        app.config['SESSION_CRYPTO_KEY'] = self.crypto_key
+        app.session_interface = EncryptedSessionInterface()
+        app.session_interface.compress_threshold = compress_threshold
+
+        @app.route('/set')
+        def set_session():
+            import uuid
+            from everyclass.server.utils.session import UserSession
+            session['user'] = UserSession('student', '3901160407', 'student;abc', '张三')
+            session['user_id'] = uuid.UUID('12345678-1234-5678-1234-567812345678')
+            flash('消息')
+            return ''
+
+        @app.route('/get')
+        def get_session():
+            return jsonify(user=session.get('user'), user_type=type(session.get('user')).__name__,
+                           user_id=str(session.get('user_id')), flashes=get_flashed_messages(),
+                           modified=session.modified)
+
+        return app
+
+    def _legacy_cookie(self, data: bytes) -> str:
+        import base64
+        from Crypto.Cipher import AES
+        cipher = AES.new(self.crypto_key, AES.MODE_EAX)
+        ciphertext, mac = cipher.encrypt_and_digest(data)
+        return ".".join(["u"] + [base64.b64encode(part).decode() for part in (ciphertext, mac, cipher.nonce)])
+
+    def test_round_trip(self):
+        for compress_threshold, prefix in ((1024, 'j'), (0, 'k')):
+            client = self._app(compress_threshold).test_client()
+            client.get('/set')
+            cookie = next(c for c in client.cookie_jar if c.name == 'e_session')
+            self.assertTrue(cookie.value.startswith(prefix + '.'))
+
+            data = client.get('/get').get_json()
+            self.assertTrue(data['user'] == ['student', '3901160407', 'student;abc', '张三'])
+            self.assertTrue(data['user_type'] == 'UserSession')
+            self.assertTrue(data['user_id'] == '12345678-1234-5678-1234-567812345678')
+            self.assertTrue(data['flashes'] == ['消息'])
+
+    def test_tampered_issued_at(self):
+        client = self._app().test_client()
+        client.get('/set')
+        cookie = next(c for c in client.cookie_jar if c.name == 'e_session')
+        parts = cookie.value.split('.')
+        parts[1] = str(int(parts[1]) + 86400)
+        client.set_cookie('localhost', 'e_session', '.'.join(parts))
+        self.assertTrue(client.get('/get').get_json()['user'] is None)
+
+    def test_legacy_pickle(self):
+        import pickle
+        import uuid
+        from everyclass.server.utils.session import UserSession
+
+        client = self._app().test_client()
+        legacy = {'user': UserSession('student', '3901160407', 'student;abc', '张三'), 'user_id': uuid.uuid4()}
+        client.set_cookie('localhost', 'e_session', self._legacy_cookie(pickle.dumps(legacy)))
+        data = client.get('/get').get_json()
+        self.assertTrue(data['user_type'] == 'UserSession')
+        self.assertTrue(data['user_id'] == str(legacy['user_id']))
+        self.assertTrue(data['modified'])  # 以新格式重新保存
+        cookie = next(c for c in client.cookie_jar if c.name == 'e_session')
+        self.assertTrue(cookie.value.startswith('j.'))
+
+    def test_legacy_pickle_disallowed_class(self):
+        import collections
+        import pickle
+
+        client = self._app().test_client()
+        client.set_cookie('localhost', 'e_session', self._legacy_cookie(pickle.dumps({'user': collections.OrderedDict()})))
+        self.assertTrue(client.get('/get').get_json()['user'] is None)
+
+
+    def test_concurrent_load(self):
+        import threading
+        import time
+        from everyclass.server.utils.session import EncryptedSession
+
+        def loader():
+            time.sleep(0.05)
+            return {'user_id': 1}, False
+
+        session = EncryptedSession(loader=loader)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(session.get('user_id'))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertTrue(results == [1] * 8)
+        self.assertTrue(session.loaded)
+
+
+class JSONEncodeTest(unittest.TestCase):
+    """everyclass/server/utils/jsonable.py"""
+
+    def test_to_json_matches_legacy(self):
+        import json
+        from dataclasses import dataclass
+        from typing import List
+        from everyclass.server.utils.jsonable import JSONSerializable, to_json
+
+        class LegacyEncoder(json.JSONEncoder):
+            """按类缓存转换函数之前的实现"""
+
+            def default(self, obj):
+                if isinstance(obj, JSONSerializable):
+                    return obj.__json_encode__()
+                return json.JSONEncoder.default(self, obj)
+
+        @dataclass
+        class Room(JSONSerializable):
+            name: str
+            floor: int
+
+            def __json_encode__(self):
+                return {'name': self.name, 'floor': self.floor, 'tags': []}
+
+        @dataclass
+        class Building(JSONSerializable):
+            name: str
+            rooms: List[Room]
+
+            def __json_encode__(self):
+                return {'name': self.name, 'rooms': self.rooms, 'meta': {}}
+
+        payloads = [
+            {'status': 'success', 'data': [Building('教学楼', [Room(f'A{i}', i % 5) for i in range(250)]), Building('空楼', [])]},
+            {'empty_list': [], 'empty_dict': {}, 'tuple': (1, 2.5, None, True), 'nested': [[], [{}], ('a', Room('B', 1))]},
+            [],
+            {},
+            Room('C101', 1),
+        ]
+        for payload in payloads:
+            self.assertTrue(to_json(payload) == json.dumps(payload, cls=LegacyEncoder))